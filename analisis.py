@@ -0,0 +1,353 @@
+import asyncio
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+
+from cache import cache_veredictos
+from db import (get_analysis, get_analyses, save_analysis, save_analyses,
+                reclamar_analisis, liberar_analisis, es_obsoleto, DB_POOL_MAX,
+                ANALISIS_PENDIENTE_VENCE_SEGUNDOS)
+from ml.predictor import predecir_ecommerce, veredicto_lexico, es_persistible, NIVEL_LEXICO
+from refresco import refrescador
+from urls import normalizar_url
+
+# Intervalo de consulta mientras otro worker analiza la misma URL
+ANALISIS_ESPERA_INTERVALO = float(os.getenv('ANALISIS_ESPERA_INTERVALO', '0.5'))
+# Análisis nuevos simultáneos por cada petición de lote
+LOTE_MAX_WORKERS = int(os.getenv('LOTE_MAX_WORKERS', '8'))
+# Un lote guarda sus veredictos cada tantos análisis o segundos, lo que llegue antes
+LOTE_TAMANO_GUARDADO = int(os.getenv('LOTE_TAMANO_GUARDADO', '100'))
+LOTE_GUARDADO_SEGUNDOS = float(os.getenv('LOTE_GUARDADO_SEGUNDOS', '2'))
+# Análisis nuevos simultáneos en los endpoints async
+ANALISIS_MAX_CONCURRENTES = int(os.getenv('ANALISIS_MAX_CONCURRENTES', '32'))
+
+
+class AnalisisIncompleto(Exception):
+    """El análisis terminó sin todas sus verificaciones y no se puede guardar"""
+
+
+class VuelosEnCurso:
+    """Agrupa las llamadas simultáneas con la misma clave en una sola ejecución"""
+
+    def __init__(self):
+        self._futuros = {}
+        self._lock = threading.Lock()
+
+    def ejecutar(self, clave, funcion):
+        with self._lock:
+            futuro = self._futuros.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = Future()
+                self._futuros[clave] = futuro
+
+        if not propio:
+            return futuro.result()
+
+        try:
+            resultado = funcion()
+            futuro.set_result(resultado)
+            return resultado
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._futuros[clave]
+
+    def en_curso(self):
+        with self._lock:
+            return len(self._futuros)
+
+
+vuelos_en_curso = VuelosEnCurso()
+
+
+def _cumple_nivel(analisis, profundo):
+    """Un veredicto léxico no sirve cuando se pide el análisis profundo"""
+    return not profundo or analisis.get("detalles", {}).get("nivel_analisis") != NIVEL_LEXICO
+
+
+def _como_analisis(url, resultado, confianza, detalles):
+    return {"url": url, "resultado": resultado, "confianza": confianza, "detalles": detalles}
+
+
+def _guardar_prediccion(url, resultado, confianza, detalles):
+    if es_persistible(detalles):
+        save_analysis(url, resultado, confianza, detalles)
+    return _como_analisis(url, resultado, confianza, detalles), "modelo ML"
+
+
+def _esperar_reclamacion(url, profundo=False):
+    """Reclama la URL o espera el resultado del worker que la tiene.
+
+    Devuelve (reclamada, existente). Si la reclamación ajena vence sin
+    resultado se retoma; si otro worker se adelanta, se analiza sin ella.
+    """
+    limite = time.monotonic() + ANALISIS_PENDIENTE_VENCE_SEGUNDOS
+    while not reclamar_analisis(url, ANALISIS_PENDIENTE_VENCE_SEGUNDOS):
+        # Otro worker la está analizando: esperar su resultado
+        time.sleep(ANALISIS_ESPERA_INTERVALO)
+        existente = get_analysis(url)
+        if existente and _cumple_nivel(existente, profundo):
+            return False, existente
+        if time.monotonic() > limite:
+            return reclamar_analisis(url, ANALISIS_PENDIENTE_VENCE_SEGUNDOS), None
+    return True, None
+
+
+def _analizar_coordinado(url, profundo=False):
+    """Analiza la URL asegurando un solo rastreo simultáneo entre workers"""
+    if not profundo:
+        # El veredicto léxico no descarga nada: no hace falta reclamar la URL
+        lexico = veredicto_lexico(url)
+        if lexico is not None:
+            return _guardar_prediccion(url, *lexico)
+
+    reclamada, existente = _esperar_reclamacion(url, profundo)
+    if existente:
+        return existente, "base de datos"
+
+    try:
+        return _guardar_prediccion(url, *predecir_ecommerce(url, profundo=True))
+    finally:
+        # Solo se borra la reclamación propia, nunca la de otro worker
+        if reclamada:
+            liberar_analisis(url)
+
+
+def _desde_cache(url, profundo=False):
+    # Un resultado obsoleto se sirve igual y se reanaliza en segundo plano
+    resultado_cache = cache_veredictos.obtener(url)
+    if not resultado_cache or not _cumple_nivel(resultado_cache, profundo):
+        return None
+    if es_obsoleto(resultado_cache):
+        refrescador.encolar(url)
+    return resultado_cache
+
+
+def _desde_bd(url, profundo=False):
+    resultado_db = get_analysis(url)
+    if not resultado_db or not _cumple_nivel(resultado_db, profundo):
+        return None
+    print("Resultado encontrado en base de datos")
+    if es_obsoleto(resultado_db):
+        refrescador.encolar(url)
+    return resultado_db
+
+
+def _analizar_nuevo(url, profundo=False):
+    # Uno solo por URL y nivel aunque lleguen varias peticiones
+    print("Realizando nuevo análisis con ML...")
+    return vuelos_en_curso.ejecutar(
+        (normalizar_url(url), profundo), lambda: _analizar_coordinado(url, profundo)
+    )
+
+
+def analizar_url(url, profundo=False):
+    """Obtiene el veredicto de una URL desde la caché, la BD o un análisis nuevo.
+
+    Devuelve (análisis, fuente). Las peticiones simultáneas de la misma URL
+    comparten un único análisis. Con `profundo=True` no se aceptan
+    veredictos léxicos: se ejecutan las verificaciones completas.
+    """
+    resultado_cache = _desde_cache(url, profundo)
+    if resultado_cache:
+        return resultado_cache, "cache"
+
+    resultado_db = _desde_bd(url, profundo)
+    if resultado_db:
+        return resultado_db, "base de datos"
+
+    return _analizar_nuevo(url, profundo)
+
+
+def resolver_trabajo(url, profundo=False):
+    """Análisis de un trabajo de la cola (worker.py); devuelve (análisis, fuente).
+
+    Reutiliza el veredicto de la BD solo si está vigente: el worker no tiene
+    refresco en segundo plano, así que uno obsoleto se analiza de nuevo.
+    """
+    existente = get_analysis(url)
+    if existente and _cumple_nivel(existente, profundo) and not es_obsoleto(existente):
+        return existente, "base de datos"
+    analisis, fuente = _analizar_nuevo(url, profundo)
+    if not es_persistible(analisis["detalles"]):
+        # Veredicto provisional (plazo agotado, host inalcanzable): fallar para
+        # que el worker lo reintente más tarde
+        raise AnalisisIncompleto(analisis["detalles"].get("advertencia", "Verificaciones incompletas"))
+    return analisis, fuente
+
+
+# Ejecutores separados: las consultas a la BD nunca esperan detrás de los rastreos
+_executor_bd = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="bd")
+_executor_analisis = ThreadPoolExecutor(max_workers=ANALISIS_MAX_CONCURRENTES, thread_name_prefix="analisis")
+_tareas_async = {}
+
+
+async def ejecutar_en_bd(funcion, *args):
+    """Ejecuta una función bloqueante de db.py sin ocupar el event loop"""
+    return await asyncio.get_running_loop().run_in_executor(_executor_bd, partial(funcion, *args))
+
+
+async def analizar_url_async(url, profundo=False):
+    """Versión no bloqueante de `analizar_url` para los endpoints async.
+
+    Los aciertos de caché se resuelven en el event loop; la BD y los
+    rastreos usan ejecutores propios, y las peticiones simultáneas de la
+    misma URL esperan una única tarea.
+    """
+    resultado_cache = _desde_cache(url, profundo)
+    if resultado_cache:
+        return resultado_cache, "cache"
+
+    resultado_db = await ejecutar_en_bd(_desde_bd, url, profundo)
+    if resultado_db:
+        return resultado_db, "base de datos"
+
+    clave = (normalizar_url(url), profundo)
+    tarea = _tareas_async.get(clave)
+    if tarea is None:
+        tarea = asyncio.get_running_loop().run_in_executor(_executor_analisis, _analizar_nuevo, url, profundo)
+        _tareas_async[clave] = tarea
+        tarea.add_done_callback(lambda _: _tareas_async.pop(clave, None))
+    # shield: si un cliente se desconecta, el análisis sigue para los demás
+    return await asyncio.shield(tarea)
+
+
+def cerrar_ejecutores():
+    _executor_bd.shutdown(wait=False, cancel_futures=True)
+    _executor_analisis.shutdown(wait=False, cancel_futures=True)
+
+
+def _analizar_para_lote(url, profundo=False):
+    """Como `_analizar_coordinado`, pero sin guardar: el lote guarda por tandas.
+
+    Devuelve (análisis, fuente, reclamada); con reclamada=True quien llama
+    libera la URL una vez guardado el veredicto.
+    """
+    if not profundo:
+        lexico = veredicto_lexico(url)
+        if lexico is not None:
+            return _como_analisis(url, *lexico), "modelo ML", False
+
+    reclamada, existente = _esperar_reclamacion(url, profundo)
+    if existente:
+        return existente, "base de datos", False
+
+    try:
+        return _como_analisis(url, *predecir_ecommerce(url, profundo=True)), "modelo ML", reclamada
+    except BaseException:
+        if reclamada:
+            liberar_analisis(url)
+        raise
+
+
+def _guardar_tanda(guardar, reclamadas):
+    try:
+        save_analyses(guardar)
+    except Exception:
+        print(f"Error al guardar {len(guardar)} análisis del lote: {traceback.format_exc()}")
+    finally:
+        for url in reclamadas:
+            try:
+                liberar_analisis(url)
+            except Exception as e:
+                # La reclamación vencerá sola
+                print(f"No se pudo liberar {url}: {e}")
+
+
+def _para_guardar(analisis, fuente):
+    if fuente != "modelo ML" or not es_persistible(analisis["detalles"]):
+        return []
+    return [(analisis["url"], analisis["resultado"], analisis["confianza"], analisis["detalles"])]
+
+
+def _guardar_abandonado(futuro):
+    # El cliente cortó el stream con el análisis en curso: se guarda al terminar
+    try:
+        analisis, fuente, reclamada = futuro.result()
+    except Exception:
+        return
+    _guardar_tanda(_para_guardar(analisis, fuente), [analisis["url"]] if reclamada else [])
+
+
+def analizar_lote(urls, max_workers=LOTE_MAX_WORKERS, profundo=False):
+    """Analiza una lista de URLs y genera (url, análisis, fuente) según van terminando.
+
+    Las URLs en caché o en la BD (una sola consulta) salen primero. El resto
+    se analiza en el ejecutor compartido, hasta `max_workers` a la vez y
+    reclamando cada URL como `analizar_url`; los veredictos se guardan con
+    un upsert multi-fila cada LOTE_TAMANO_GUARDADO análisis o
+    LOTE_GUARDADO_SEGUNDOS. Si un análisis falla se genera (url, None,
+    mensaje de error).
+    """
+    urls = list(dict.fromkeys(urls))
+
+    pendientes = []
+    for url in urls:
+        resultado_cache = cache_veredictos.obtener(url)
+        if resultado_cache and _cumple_nivel(resultado_cache, profundo):
+            if es_obsoleto(resultado_cache):
+                refrescador.encolar(url)
+            yield url, resultado_cache, "cache"
+        else:
+            pendientes.append(url)
+
+    encontrados = get_analyses(pendientes)
+    nuevos = {}
+    for url in pendientes:
+        if url in encontrados and _cumple_nivel(encontrados[url], profundo):
+            if es_obsoleto(encontrados[url]):
+                refrescador.encolar(url)
+            yield url, encontrados[url], "base de datos"
+        else:
+            # Variantes de la misma URL canónica comparten un único análisis
+            nuevos.setdefault(normalizar_url(url), []).append(url)
+
+    cola = deque(nuevos.values())
+    en_curso = {}
+    guardar, reclamadas = [], []
+    proximo_guardado = None
+    try:
+        while cola or en_curso:
+            while cola and len(en_curso) < max_workers:
+                variantes = cola.popleft()
+                en_curso[_executor_analisis.submit(_analizar_para_lote, variantes[0], profundo)] = variantes
+
+            espera = None if proximo_guardado is None else max(0, proximo_guardado - time.monotonic())
+            hechos, _ = wait(en_curso, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                variantes = en_curso.pop(futuro)
+                try:
+                    analisis, fuente, reclamada = futuro.result()
+                except Exception as e:
+                    print(f"Error al analizar {variantes[0]} en lote: {traceback.format_exc()}")
+                    for url in variantes:
+                        yield url, None, str(e)
+                    continue
+                guardar.extend(_para_guardar(analisis, fuente))
+                if reclamada:
+                    reclamadas.append(variantes[0])
+                if proximo_guardado is None and (guardar or reclamadas):
+                    proximo_guardado = time.monotonic() + LOTE_GUARDADO_SEGUNDOS
+                for url in variantes:
+                    yield url, analisis, fuente
+
+            if proximo_guardado is not None and (
+                len(guardar) >= LOTE_TAMANO_GUARDADO or time.monotonic() >= proximo_guardado
+            ):
+                _guardar_tanda(guardar, reclamadas)
+                guardar, reclamadas = [], []
+                proximo_guardado = None
+    finally:
+        # También si el cliente corta el stream: se guarda lo ya analizado
+        # y los análisis en curso se guardan al terminar
+        for futuro in en_curso:
+            if not futuro.cancel():
+                futuro.add_done_callback(_guardar_abandonado)
+        _guardar_tanda(guardar, reclamadas)
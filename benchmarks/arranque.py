@@ -0,0 +1,89 @@
+"""Mide cuánto tarda un worker en estar listo y falla si supera el presupuesto.
+
+Cada repetición arranca un intérprete nuevo que importa `main` y ejecuta
+`calentar()` (lo mismo que hace el lifespan antes de tocar la BD).
+
+    python benchmarks/arranque.py --repeticiones 5 --presupuesto 1.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Presupuesto (segundos) de importación + calentamiento, sin contar la BD
+PRESUPUESTO_ARRANQUE_SEGUNDOS = float(os.getenv('PRESUPUESTO_ARRANQUE_SEGUNDOS', '1.0'))
+
+CODIGO = """
+import time
+inicio = time.perf_counter()
+import main
+importado = time.perf_counter()
+from ml.predictor import calentar
+calentar()
+listo = time.perf_counter()
+import sys
+print(importado - inicio, listo - inicio, 'numpy' in sys.modules)
+"""
+
+
+def medir():
+    salida = subprocess.run(
+        [sys.executable, '-c', CODIGO], cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(salida[-3]), float(salida[-2]), salida[-1] == 'True'
+
+
+def modulos_mas_lentos(cantidad):
+    """Módulos con mayor tiempo acumulado según `python -X importtime`"""
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=RAIZ, capture_output=True, text=True, check=True
+    ).stderr
+    tiempos = []
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, modulo = linea[len('import time:'):].split('|')
+        tiempos.append((int(acumulado), modulo.rstrip()))
+    return sorted(tiempos, reverse=True)[:cantidad]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--presupuesto', type=float, default=PRESUPUESTO_ARRANQUE_SEGUNDOS)
+    parser.add_argument('--detalle', type=int, default=0, help='mostrar los N módulos más lentos')
+    args = parser.parse_args()
+
+    importacion, listo = [], []
+    numpy_cargado = False
+    for _ in range(args.repeticiones):
+        segundos_importacion, segundos_listo, con_numpy = medir()
+        importacion.append(segundos_importacion)
+        listo.append(segundos_listo)
+        numpy_cargado = numpy_cargado or con_numpy
+
+    mediana = statistics.median(listo)
+    print(f"importación: mediana {statistics.median(importacion) * 1000:.0f} ms, "
+          f"máximo {max(importacion) * 1000:.0f} ms")
+    print(f"listo:       mediana {mediana * 1000:.0f} ms, máximo {max(listo) * 1000:.0f} ms "
+          f"(presupuesto {args.presupuesto * 1000:.0f} ms)")
+    if numpy_cargado:
+        print("⚠️ numpy se carga al arrancar; solo debería importarse en el triage por lotes")
+
+    if args.detalle:
+        for acumulado, modulo in modulos_mas_lentos(args.detalle):
+            print(f"  {acumulado / 1000:8.1f} ms  {modulo.strip()}")
+
+    if mediana > args.presupuesto:
+        print("❌ El arranque supera el presupuesto")
+        return 1
+    print("✅ Arranque dentro del presupuesto")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Tiendas sintéticas servidas en local para medir el análisis sin salir a internet.
+
+Cada sitio escucha en su propio puerto (127.0.0.1), así el límite de
+conexiones por host de `ml.red` se aplica igual que con dominios reales.
+Las páginas llevan ETag y responden 304 a las peticiones condicionales.
+"""
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PRODUCTO = (
+    '<div class="producto"><h3>Zapatilla {i}</h3><p>Precio especial, envío gratis '
+    'y devolución en 30 días.</p><a href="/producto/{i}">Ver</a></div>'
+)
+
+PIE = (
+    '<footer><a href="/terminos-y-condiciones">Términos y condiciones</a>'
+    '<a href="/privacidad">Privacidad</a><a href="/contacto">Contacto</a>'
+    '<a href="/nosotros">Nosotros</a><a href="/ayuda">Ayuda</a>'
+    '<p>Dirección: Calle 10 # 20-30. Teléfono +57 300 123 4567. '
+    'ventas@tienda.test. Cámara de comercio y superintendencia de industria.</p></footer>'
+)
+
+RESENAS = (
+    '<section class="reviews"><h2>Deja tu comentario</h2>'
+    '<p>Fue una estafa, no llega el pedido, pésimo reembolso.</p>'
+    '<p>Otro problema: producto defectuoso y no responde nadie.</p></section>'
+)
+
+
+def _pagina(cuerpo):
+    return f'<!doctype html><html><head><meta charset="utf-8"><title>Tienda</title></head><body>{cuerpo}</body></html>'
+
+
+def _productos(cantidad):
+    return ''.join(PRODUCTO.format(i=i) for i in range(cantidad))
+
+
+def _anidado(profundidad):
+    return '<div class="capa">' * profundidad + 'Oferta escondida' + '</div>' * profundidad
+
+
+class Sitio:
+    """Páginas de una tienda: {ruta: (estado, cuerpo)}; el resto responde 404"""
+
+    def __init__(self, nombre, inicio, paginas=None, retraso=0.0, estado_por_defecto=404):
+        self.nombre = nombre
+        self.paginas = {'/': (200, inicio.encode('utf-8'))}
+        for ruta, (estado, cuerpo) in (paginas or {}).items():
+            self.paginas[ruta] = (estado, cuerpo.encode('utf-8'))
+        self.retraso = retraso
+        self.estado_por_defecto = estado_por_defecto
+
+
+_LEGALES = {
+    ruta: (200, _pagina('<h1>Documento legal</h1>'))
+    for ruta in ('/terminos-y-condiciones', '/privacidad', '/contacto', '/nosotros', '/ayuda')
+}
+
+
+def crear_corpus():
+    """Sitios del corpus: páginas pequeñas y enormes, DOM profundo, lentos, enlaces rotos, sin términos"""
+    return [
+        Sitio('pequena', _pagina(_productos(5) + PIE), _LEGALES),
+        Sitio('grande', _pagina(_productos(15000) + RESENAS + PIE), _LEGALES),
+        Sitio('anidada', _pagina(_anidado(2000) + _productos(20) + PIE), _LEGALES),
+        Sitio('lenta', _pagina(_productos(20) + PIE), _LEGALES, retraso=1.5),
+        Sitio('enlaces_rotos', _pagina(_productos(20) + RESENAS + PIE), {
+            ruta: (410 if i % 2 else 404, 'no') for i, ruta in enumerate(_LEGALES)
+        }),
+        Sitio('sin_terminos', _pagina(_productos(20) + RESENAS)),
+    ]
+
+
+def _manejador(sitio):
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_HEAD(self):
+            self._responder(con_cuerpo=False)
+
+        def do_GET(self):
+            self._responder(con_cuerpo=True)
+
+        def _responder(self, con_cuerpo):
+            if sitio.retraso and self.path == '/':
+                time.sleep(sitio.retraso)
+            estado, cuerpo = sitio.paginas.get(self.path.split('?')[0], (sitio.estado_por_defecto, b'no'))
+            etag = f'"{zlib.crc32(cuerpo):x}"'
+            if estado == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(estado)
+            if estado == 200:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            if con_cuerpo:
+                self.wfile.write(cuerpo)
+
+    return Manejador
+
+
+class ServidorCorpus:
+    """Levanta un servidor HTTP por sitio en hilos de fondo"""
+
+    def __init__(self, sitios=None):
+        self.sitios = sitios or crear_corpus()
+        self.urls = {}
+        self._servidores = []
+
+    def __enter__(self):
+        for sitio in self.sitios:
+            servidor = ThreadingHTTPServer(('127.0.0.1', 0), _manejador(sitio))
+            servidor.daemon_threads = True
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            self._servidores.append(servidor)
+            self.urls[sitio.nombre] = f'http://127.0.0.1:{servidor.server_address[1]}'
+        return self
+
+    def __exit__(self, *exc):
+        for servidor in self._servidores:
+            servidor.shutdown()
+            servidor.server_close()
+        self._servidores = []
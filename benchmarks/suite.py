@@ -0,0 +1,252 @@
+"""Benchmark del análisis contra el corpus local: verificaciones, predicción y endpoint.
+
+Informa p50/p95/p99 y rendimiento (operaciones por segundo) de cada capa:
+
+    python benchmarks/suite.py --repeticiones 10 --concurrencia 4
+    python benchmarks/suite.py --capas prediccion --json resultados.json
+
+Las URLs del corpus son IPs sin HTTPS (veredicto léxico inmediato), así que
+la predicción y el endpoint se miden con el análisis profundo. El endpoint
+corre en un uvicorn local con la base de datos sustituida por `BDMemoria`.
+Cada ejecución usa una caché de páginas vacía propia: tras la primera
+repetición las páginas se revalidan con 304 (`--sin-cache-paginas` lo evita).
+El límite de peticiones por segundo por host se desactiva por defecto: el
+corpus es local y las repeticiones golpean siempre los mismos hosts.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import requests  # noqa: E402
+
+from corpus import ServidorCorpus  # noqa: E402
+from ml.cache_paginas import cache_paginas  # noqa: E402
+from ml.enlaces import probador_enlaces  # noqa: E402
+from ml.pagina import PaginaSnapshot  # noqa: E402
+from ml.predictor import VERIFICACIONES, predecir_ecommerce  # noqa: E402
+from ml.red import cliente_http  # noqa: E402
+
+CAPAS = ('verificaciones', 'prediccion', 'endpoint')
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return 0.0
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def resumir(nombre, duraciones, segundos_totales):
+    duraciones = sorted(duraciones)
+    return {
+        "nombre": nombre,
+        "n": len(duraciones),
+        "p50_ms": round(percentil(duraciones, 50) * 1000, 2),
+        "p95_ms": round(percentil(duraciones, 95) * 1000, 2),
+        "p99_ms": round(percentil(duraciones, 99) * 1000, 2),
+        "ops_por_segundo": round(len(duraciones) / segundos_totales, 2) if segundos_totales else 0.0,
+    }
+
+
+def medir_concurrente(funcion, argumentos, concurrencia):
+    """Ejecuta `funcion` con cada argumento; devuelve (duraciones, segundos totales, resultados)"""
+    def cronometrada(argumento):
+        inicio = time.perf_counter()
+        resultado = funcion(argumento)
+        return time.perf_counter() - inicio, resultado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        salidas = list(executor.map(cronometrada, argumentos))
+    return [d for d, _ in salidas], time.perf_counter() - inicio, [r for _, r in salidas]
+
+
+def _olvidar_sondeos():
+    # Cada repetición sondea los enlaces de verdad, como un análisis en frío
+    with probador_enlaces._lock:
+        probador_enlaces._resultados.clear()
+
+
+def bench_verificaciones(urls, repeticiones):
+    """Cada verificación por separado, con la página ya descargada y parseada"""
+    descargas = {}
+    for sitio, url in urls.items():
+        respuesta = cliente_http.get(url, 30)
+        descargas[sitio] = (url, respuesta.status_code, respuesta.contenido)
+
+    filas = []
+    for nombre, verificacion in VERIFICACIONES.items():
+        duraciones = []
+        total = 0.0
+        for _ in range(repeticiones):
+            for url, estado, html in descargas.values():
+                pagina = PaginaSnapshot(url, status_code=estado, html=html, encoding='utf-8')
+                pagina.parsear()
+                _olvidar_sondeos()
+                inicio = time.perf_counter()
+                verificacion(url, pagina)
+                duraciones.append(time.perf_counter() - inicio)
+                total += duraciones[-1]
+        filas.append(resumir(f"verificar:{nombre}", duraciones, total))
+    return filas
+
+
+def bench_prediccion(urls, repeticiones, concurrencia):
+    filas = []
+    todas = []
+    total = 0.0
+    for sitio, url in urls.items():
+        def predecir(_):
+            _olvidar_sondeos()
+            return predecir_ecommerce(url, profundo=True)
+        duraciones, segundos, _ = medir_concurrente(predecir, range(repeticiones), concurrencia)
+        filas.append(resumir(f"predecir:{sitio}", duraciones, segundos))
+        todas.extend(duraciones)
+        total += segundos
+    filas.append(resumir("predecir:todos", todas, total))
+    return filas
+
+
+class BDMemoria:
+    """Sustituto en memoria de las funciones de db.py que usa la API"""
+
+    def __init__(self):
+        self.filas = {}
+        self._lock = threading.Lock()
+
+    def save_analysis(self, url, resultado, confianza, detalles):
+        from cache import cache_veredictos
+        analisis = {"url": url, "resultado": resultado, "confianza": confianza,
+                    "detalles": detalles, "actualizado_en": time.time()}
+        with self._lock:
+            self.filas[url] = analisis
+        cache_veredictos.guardar(url, analisis)
+
+    def save_analyses(self, analisis):
+        for fila in analisis:
+            self.save_analysis(*fila)
+
+    def get_analysis(self, url):
+        with self._lock:
+            return self.filas.get(url)
+
+    def get_analyses(self, urls):
+        with self._lock:
+            return {url: self.filas[url] for url in urls if url in self.filas}
+
+    def instalar(self):
+        import analisis
+        import main
+        import refresco
+        for modulo, nombres in (
+            (analisis, ('save_analysis', 'save_analyses', 'get_analysis', 'get_analyses')),
+            (refresco, ('save_analysis',)),
+        ):
+            for nombre in nombres:
+                setattr(modulo, nombre, getattr(self, nombre))
+        analisis.reclamar_analisis = lambda url, vencimiento: True
+        analisis.liberar_analisis = lambda url: None
+        refresco.list_stale_urls = lambda **kwargs: []
+        main.init_db = main.init_pool = main.close_pool = main.ping = lambda: None
+        main.estadisticas_pool = lambda: {"en_uso": 0}
+        main.contar_analisis = lambda: len(self.filas)
+        return main.app
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_endpoint(urls, repeticiones, concurrencia):
+    """POST /analizar/ sobre HTTP real; la primera petición de cada URL es un análisis nuevo"""
+    import uvicorn
+
+    app = BDMemoria().instalar()
+    puerto = _puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=puerto, log_level='warning'))
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.05)
+
+    sesion = requests.Session()
+    base = f'http://127.0.0.1:{puerto}'
+
+    def analizar(url):
+        respuesta = sesion.post(f'{base}/analizar/', json={"url": url, "profundo": True})
+        respuesta.raise_for_status()
+        return respuesta.json()["fuente"]
+
+    try:
+        duraciones, segundos, fuentes = medir_concurrente(
+            analizar, [url for url in urls.values() for _ in range(repeticiones)], concurrencia
+        )
+    finally:
+        servidor.should_exit = True
+        hilo.join(10)
+
+    filas = [resumir("endpoint:todos", duraciones, segundos)]
+    for fuente in sorted(set(fuentes)):
+        propias = [d for d, f in zip(duraciones, fuentes) if f == fuente]
+        filas.append(resumir(f"endpoint:{fuente}", propias, segundos))
+    return filas
+
+
+def imprimir(filas):
+    print(f"{'medida':<42} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>9}")
+    for fila in filas:
+        print(f"{fila['nombre']:<42} {fila['n']:>5} {fila['p50_ms']:>10.2f} {fila['p95_ms']:>10.2f} "
+              f"{fila['p99_ms']:>10.2f} {fila['ops_por_segundo']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--concurrencia', type=int, default=4)
+    parser.add_argument('--capas', default=','.join(CAPAS), help=f'subconjunto de {",".join(CAPAS)}')
+    parser.add_argument('--json', help='guardar los resultados en este archivo')
+    parser.add_argument('--sin-cache-paginas', action='store_true', help='descargar y parsear siempre')
+    parser.add_argument('--peticiones-por-segundo', type=float, default=0,
+                        help='límite por host de ml.red (0 = sin límite)')
+    args = parser.parse_args()
+
+    capas = [capa.strip() for capa in args.capas.split(',') if capa.strip()]
+    desconocidas = set(capas) - set(CAPAS)
+    if desconocidas:
+        parser.error(f"capas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    directorio = tempfile.TemporaryDirectory()
+    cache_paginas.ruta = '' if args.sin_cache_paginas else os.path.join(directorio.name, 'paginas.sqlite3')
+
+    cliente_http.por_segundo = args.peticiones_por_segundo
+
+    filas = []
+    with directorio, ServidorCorpus() as corpus:
+        if 'verificaciones' in capas:
+            filas += bench_verificaciones(corpus.urls, args.repeticiones)
+        if 'prediccion' in capas:
+            filas += bench_prediccion(corpus.urls, args.repeticiones, args.concurrencia)
+        if 'endpoint' in capas:
+            filas += bench_endpoint(corpus.urls, args.repeticiones, args.concurrencia)
+
+    imprimir(filas)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(filas, archivo, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from urls import normalizar_url
+
+CACHE_MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRADAS', '10000'))
+CACHE_TTL_SEGUNDOS = float(os.getenv('CACHE_TTL_SEGUNDOS', '300'))
+
+
+class CacheVeredictos:
+    """Caché LRU en memoria, con caducidad, de los veredictos más recientes.
+
+    Las claves son URLs normalizadas; al superar `max_entradas` se desaloja
+    la entrada usada hace más tiempo.
+    """
+
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expiraciones = 0
+
+    def obtener(self, url):
+        clave = normalizar_url(url)
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, url, valor):
+        clave = normalizar_url(url)
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, url):
+        with self._lock:
+            self._datos.pop(normalizar_url(url), None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "expiraciones": self.expiraciones,
+            }
+
+
+# Caché compartida por la API y la capa de base de datos
+cache_veredictos = CacheVeredictos()
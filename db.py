@@ -1,47 +1,317 @@
 import psycopg2
 import os
 import json
+import base64
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-import sys
+from cache import cache_veredictos
+from ml.metricas import DURACION_BD
+from urls import normalizar_url, clave_url
 # Cargar variables de entorno
 load_dotenv()
 
+
+class ConfiguracionIncompleta(Exception):
+    """Falta una variable de entorno obligatoria"""
+
+
+class MigracionFallida(Exception):
+    """Una migración del esquema no se pudo aplicar: la aplicación no debe arrancar"""
+
+
 # Obtener variables de entorno SIN valores por defecto
 def get_env_variable(var_name):
-    """Obtiene una variable de entorno o muestra error si no existe"""
+    """Obtiene una variable de entorno o lanza ConfiguracionIncompleta si no existe"""
     value = os.getenv(var_name)
     if value is None:
-        print(f"❌ ERROR: La variable de entorno {var_name} no está definida")
-        print("   Asegúrate de tener un archivo .env con todas las variables requeridas")
-        sys.exit(1)
+        raise ConfiguracionIncompleta(
+            f"La variable de entorno {var_name} no está definida. "
+            "Asegúrate de tener un archivo .env con todas las variables requeridas"
+        )
     return value
 
+# Configuración del pool de conexiones
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_MAX_USOS = int(os.getenv('DB_POOL_MAX_USOS', '1000'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_PING_SEGUNDOS = float(os.getenv('DB_POOL_PING_SEGUNDOS', '5'))
+
+# Cerrojo de init_db: dos procesos que arrancan a la vez no migran el esquema en paralelo
+_CERROJO_ESQUEMA = 7210423
 
-DB_HOST = get_env_variable('DB_HOST')
-DB_NAME = get_env_variable('DB_NAME')
-DB_USER = get_env_variable('DB_USER')
-DB_PASS = get_env_variable('DB_PASS')
-DB_PORT = get_env_variable('DB_PORT')
+# Estados de un trabajo de la cola de análisis
+TRABAJO_PENDIENTE = 'pendiente'
+TRABAJO_EN_CURSO = 'en_curso'
+TRABAJO_COMPLETADO = 'completado'
+TRABAJO_FALLIDO = 'fallido'
+
+# Edad máxima (segundos) de un análisis antes de considerarlo obsoleto
+ANALISIS_MAX_EDAD_SEGUNDOS = float(os.getenv('ANALISIS_MAX_EDAD_SEGUNDOS', str(7 * 24 * 3600)))
+# Tiempo tras el cual una reclamación de otro worker se da por abandonada
+ANALISIS_PENDIENTE_VENCE_SEGUNDOS = float(os.getenv('ANALISIS_PENDIENTE_VENCE_SEGUNDOS', '60'))
 
 def get_connection():
+    # Las credenciales se leen al conectar, no al importar el módulo
     return psycopg2.connect(
-        host=DB_HOST,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        port=DB_PORT
+        host=get_env_variable('DB_HOST'),
+        dbname=get_env_variable('DB_NAME'),
+        user=get_env_variable('DB_USER'),
+        password=get_env_variable('DB_PASS'),
+        port=get_env_variable('DB_PORT')
     )
 
+class PoolConexiones:
+    """Pool de conexiones PostgreSQL compartido por todas las funciones de este módulo.
+
+    Al prestar una conexión comprueba que siga viva (SELECT 1 si estuvo
+    inactiva más de `ping_segundos`) y la recicla tras `max_usos` préstamos.
+    Si no hay conexiones libres, espera hasta `timeout` segundos.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, max_usos=DB_POOL_MAX_USOS,
+                 timeout=DB_POOL_TIMEOUT, ping_segundos=DB_POOL_PING_SEGUNDOS):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_usos = max_usos
+        self.timeout = timeout
+        self.ping_segundos = ping_segundos
+        self._libres = []
+        self._usos = {}
+        self._ultimo_uso = {}
+        self._total = 0
+        self._prestadas = 0
+        self._cerrado = False
+        self._lock = threading.Lock()
+        self._disponibles = threading.BoundedSemaphore(maxconn)
+        try:
+            for _ in range(minconn):
+                self._libres.append(self._abrir())
+        except Exception as e:
+            print(f"Error al abrir conexiones iniciales del pool: {e}")
+
+    def _abrir(self):
+        conn = get_connection()
+        with self._lock:
+            self._total += 1
+            self._usos[id(conn)] = 0
+            self._ultimo_uso[id(conn)] = time.monotonic()
+        return conn
+
+    def _descartar(self, conn):
+        with self._lock:
+            self._total -= 1
+            self._usos.pop(id(conn), None)
+            self._ultimo_uso.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _sana(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._ultimo_uso.get(id(conn), 0) < self.ping_segundos:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def prestar(self):
+        if self._cerrado:
+            raise RuntimeError("El pool de conexiones está cerrado")
+        if not self._disponibles.acquire(timeout=self.timeout):
+            raise RuntimeError("No hay conexiones libres en el pool de base de datos")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._libres.pop() if self._libres else None
+                if conn is None:
+                    conn = self._abrir()
+                elif not self._sana(conn):
+                    self._descartar(conn)
+                    continue
+                with self._lock:
+                    self._usos[id(conn)] += 1
+                    self._prestadas += 1
+                return conn
+        except Exception:
+            self._disponibles.release()
+            raise
+
+    def devolver(self, conn):
+        try:
+            if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.closed or self._cerrado or self._usos.get(id(conn), 0) >= self.max_usos:
+                self._descartar(conn)
+            else:
+                with self._lock:
+                    self._ultimo_uso[id(conn)] = time.monotonic()
+                    self._libres.append(conn)
+        except Exception:
+            self._descartar(conn)
+        finally:
+            with self._lock:
+                self._prestadas -= 1
+            self._disponibles.release()
+
+    @contextmanager
+    def conexion(self):
+        conn = self.prestar()
+        try:
+            yield conn
+        finally:
+            self.devolver(conn)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "abiertas": self._total,
+                "libres": len(self._libres),
+                "en_uso": self._prestadas,
+                "maximo": self.maxconn,
+                "saturacion": round(self._prestadas / self.maxconn, 2) if self.maxconn else 1.0
+            }
+
+    def cerrar(self):
+        self._cerrado = True
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for conn in libres:
+            self._descartar(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def init_pool():
+    """Crea el pool compartido (se llama una vez al arrancar la aplicación)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexiones()
+        return _pool
+
+def close_pool():
+    """Cierra el pool compartido (se llama al apagar la aplicación)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+def conexion():
+    """Presta una conexión del pool compartido, creándolo si hace falta"""
+    return (_pool or init_pool()).conexion()
+
+def estadisticas_pool():
+    """Estado del pool actual; sin pool (antes de arrancar o tras cerrarlo) todo a 0.
+
+    No crea el pool: consultar las métricas no debe abrir conexiones.
+    """
+    pool = _pool
+    if pool is None:
+        return {"abiertas": 0, "libres": 0, "en_uso": 0, "maximo": DB_POOL_MAX, "saturacion": 0.0}
+    return pool.estadisticas()
+
+def ping():
+    """SELECT 1 con una conexión del pool; lanza excepción si la BD no responde"""
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        finally:
+            cur.close()
+
+def _clave(url):
+    return psycopg2.Binary(clave_url(url))
+
+def _requiere_migracion_url_hash(cur):
+    """True si analisis aún no tiene url_hash completo e indexado.
+
+    Solo consulta el catálogo: en el caso habitual (ya migrada) el arranque
+    no toma ningún bloqueo sobre la tabla.
+    """
+    cur.execute("""
+        SELECT is_nullable FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'analisis' AND column_name = 'url_hash'
+    """)
+    columna = cur.fetchone()
+    if columna is None or columna[0] == 'YES':
+        return True
+    cur.execute("""
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = current_schema() AND indexname = 'idx_analisis_url_hash'
+    """)
+    if cur.fetchone() is None:
+        return True
+    cur.execute("""
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'analisis'::regclass AND conname = 'analisis_url_key'
+    """)
+    return cur.fetchone() is not None
+
+def _migrar_url_hash(cur):
+    """Añade url_hash a una tabla analisis anterior y la deja indexada por él.
+
+    Rellena el hash de las filas existentes; si varias resultan ser la misma
+    URL canónica se conserva la actualizada más recientemente. Después se
+    elimina el UNIQUE(url), ya innecesario.
+    """
+    # ACCESS EXCLUSIVE sobre analisis: por eso solo se ejecuta si hace falta
+    cur.execute("ALTER TABLE analisis ADD COLUMN IF NOT EXISTS url_hash BYTEA")
+    cur.execute("""
+        SELECT id, url FROM analisis WHERE url_hash IS NULL
+        ORDER BY fecha_actualizacion DESC, id DESC
+    """)
+    conservadas = {}
+    duplicadas = []
+    for id_, url in cur.fetchall():
+        clave = clave_url(url)
+        if clave in conservadas:
+            duplicadas.append(id_)
+        else:
+            conservadas[clave] = (id_, psycopg2.Binary(clave))
+    if duplicadas:
+        cur.execute("DELETE FROM analisis WHERE id = ANY(%s)", (duplicadas,))
+    if conservadas:
+        execute_values(cur, """
+            UPDATE analisis AS a SET url_hash = v.url_hash
+            FROM (VALUES %s) AS v (id, url_hash)
+            WHERE a.id = v.id
+        """, list(conservadas.values()))
+        print(f"Migradas {len(conservadas)} URLs a url_hash ({len(duplicadas)} duplicadas fusionadas)")
+    cur.execute("ALTER TABLE analisis DROP CONSTRAINT IF EXISTS analisis_url_key")
+    cur.execute("ALTER TABLE analisis ALTER COLUMN url_hash SET NOT NULL")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_analisis_url_hash
+        ON analisis (url_hash)
+    """)
+
 def init_db():
-    """Inicializar la base de datos PostgreSQL"""
+    """Inicializar la base de datos PostgreSQL (se llama una vez al arrancar la aplicación)"""
+    conn = None
     try:
         conn = get_connection()
         cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_CERROJO_ESQUEMA,))
+        # Las búsquedas van por url_hash (blake2b de 16 bytes de la URL canónica):
+        # un índice de ancho fijo en lugar de uno sobre el texto completo
         cur.execute("""
             CREATE TABLE IF NOT EXISTS analisis (
                 id SERIAL PRIMARY KEY,
-                url TEXT UNIQUE NOT NULL,
+                url TEXT NOT NULL,
+                url_hash BYTEA NOT NULL,
                 resultado VARCHAR(20) NOT NULL,
                 confianza FLOAT NOT NULL,
                 detalles JSONB,
@@ -49,78 +319,490 @@ def init_db():
                 fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # Tablas creadas antes de url_hash (o recién creadas, sin su índice)
+        if _requiere_migracion_url_hash(cur):
+            try:
+                _migrar_url_hash(cur)
+            except Exception as e:
+                # Sin url_hash los upserts fallarían todos: mejor no arrancar
+                raise MigracionFallida(f"No se pudo migrar analisis a url_hash: {e}") from e
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analisis_fecha_actualizacion
+            ON analisis (fecha_actualizacion)
+        """)
+        # Paginación por cursor sobre (fecha_creacion, id), con y sin filtro por resultado
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analisis_fecha_creacion_id
+            ON analisis (fecha_creacion DESC, id DESC)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analisis_resultado_fecha_creacion_id
+            ON analisis (resultado, fecha_creacion DESC, id DESC)
+        """)
+        # Análisis en curso: coordina a los workers para no rastrear la misma URL a la vez
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS analisis_pendientes (
+                url TEXT PRIMARY KEY,
+                iniciado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Cola de análisis: la API encola y worker.py los ejecuta
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id BIGSERIAL PRIMARY KEY,
+                url TEXT NOT NULL,
+                url_hash BYTEA NOT NULL,
+                profundo BOOLEAN NOT NULL DEFAULT FALSE,
+                estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                resultado JSONB,
+                disponible_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Tablas creadas antes de guardar el resultado en el propio trabajo
+        cur.execute("ALTER TABLE trabajos ADD COLUMN IF NOT EXISTS resultado JSONB")
+        # Un solo trabajo activo por URL y nivel
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_trabajos_activo_url
+            ON trabajos (url_hash, profundo) WHERE estado IN ('pendiente', 'en_curso')
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_trabajos_cola
+            ON trabajos (disponible_en, id) WHERE estado IN ('pendiente', 'en_curso')
+        """)
         conn.commit()
         print("Base de datos PostgreSQL inicializada correctamente")
+    except (ConfiguracionIncompleta, MigracionFallida):
+        raise
     except Exception as e:
         print(f"Error al inicializar BD PostgreSQL: {e}")
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
 
+@DURACION_BD.cronometrado(operacion="save_analysis")
 def save_analysis(url, resultado, confianza, detalles):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        # PostgreSQL usa %s como placeholder y soporta JSONB nativamente
-        cur.execute(
-            """
-            INSERT INTO analisis (url, resultado, confianza, detalles)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (url) 
-            DO UPDATE SET 
-                resultado = EXCLUDED.resultado,
-                confianza = EXCLUDED.confianza,
-                detalles = EXCLUDED.detalles,
-                fecha_actualizacion = CURRENT_TIMESTAMP
-            """, (url, resultado, confianza, json.dumps(detalles))
-        )
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            # PostgreSQL usa %s como placeholder y soporta JSONB nativamente
+            cur.execute(
+                """
+                INSERT INTO analisis (url, url_hash, resultado, confianza, detalles)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (url_hash) 
+                DO UPDATE SET 
+                    url = EXCLUDED.url,
+                    resultado = EXCLUDED.resultado,
+                    confianza = EXCLUDED.confianza,
+                    detalles = EXCLUDED.detalles,
+                    fecha_actualizacion = CURRENT_TIMESTAMP
+                """, (url, _clave(url), resultado, confianza, json.dumps(detalles))
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+    
+    # Escritura directa en la caché: la siguiente consulta no toca la BD
+    cache_veredictos.guardar(url, {
+        "url": url,
+        "resultado": resultado,
+        "confianza": confianza,
+        "detalles": detalles,
+        "actualizado_en": time.time()
+    })
 
+@DURACION_BD.cronometrado(operacion="get_analysis")
 def get_analysis(url):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT url, resultado, confianza, detalles FROM analisis WHERE url = %s", 
-            (url,)
-        )
-        result = cur.fetchone()
-        if result:
-            return {
-                "url": result[0],
-                "resultado": result[1],
-                "confianza": result[2],
-                "detalles": result[3] or {}
-            }
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT url, resultado, confianza, detalles,
+                       EXTRACT(EPOCH FROM (LOCALTIMESTAMP - fecha_actualizacion))
+                FROM analisis WHERE url_hash = %s
+                """, 
+                (_clave(url),)
+            )
+            result = cur.fetchone()
+            if result:
+                analisis = {
+                    "url": result[0],
+                    "resultado": result[1],
+                    "confianza": result[2],
+                    "detalles": result[3] or {},
+                    # Marca absoluta para poder evaluar la edad también desde la caché
+                    "actualizado_en": time.time() - float(result[4] or 0)
+                }
+                cache_veredictos.guardar(url, analisis)
+                return analisis
+            return None
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="save_analyses")
+def save_analyses(analisis):
+    """Guarda varios análisis con un único upsert multi-fila.
+
+    `analisis` es una lista de tuplas (url, resultado, confianza, detalles);
+    si una URL se repite (en su forma canónica) se conserva la última.
+    """
+    filas = {}
+    for url, resultado, confianza, detalles in analisis:
+        filas[clave_url(url)] = (url, _clave(url), resultado, confianza, json.dumps(detalles))
+    if not filas:
+        return
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            execute_values(
+                cur,
+                """
+                INSERT INTO analisis (url, url_hash, resultado, confianza, detalles)
+                VALUES %s
+                ON CONFLICT (url_hash) 
+                DO UPDATE SET 
+                    url = EXCLUDED.url,
+                    resultado = EXCLUDED.resultado,
+                    confianza = EXCLUDED.confianza,
+                    detalles = EXCLUDED.detalles,
+                    fecha_actualizacion = CURRENT_TIMESTAMP
+                """, list(filas.values()), page_size=len(filas)
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+    
+    ahora = time.time()
+    for url, resultado, confianza, detalles in analisis:
+        cache_veredictos.guardar(url, {
+            "url": url,
+            "resultado": resultado,
+            "confianza": confianza,
+            "detalles": detalles,
+            "actualizado_en": ahora
+        })
+
+@DURACION_BD.cronometrado(operacion="get_analyses")
+def get_analyses(urls):
+    """Busca varias URLs con una sola consulta; devuelve {url: análisis}.
+
+    Las claves del resultado son las URLs tal como se pidieron.
+    """
+    if not urls:
+        return {}
+    pedidas = {}
+    for url in urls:
+        pedidas.setdefault(clave_url(url), []).append(url)
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT url_hash, url, resultado, confianza, detalles,
+                       EXTRACT(EPOCH FROM (LOCALTIMESTAMP - fecha_actualizacion))
+                FROM analisis WHERE url_hash = ANY(%s)
+                """,
+                ([psycopg2.Binary(clave) for clave in pedidas],)
+            )
+            encontrados = {}
+            ahora = time.time()
+            for r in cur.fetchall():
+                analisis = {
+                    "url": r[1],
+                    "resultado": r[2],
+                    "confianza": r[3],
+                    "detalles": r[4] or {},
+                    "actualizado_en": ahora - float(r[5] or 0)
+                }
+                cache_veredictos.guardar(r[1], analisis)
+                for url in pedidas.get(bytes(r[0]), ()):
+                    encontrados[url] = analisis
+            return encontrados
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="reclamar_analisis")
+def reclamar_analisis(url, vencimiento):
+    """Marca la URL (en su forma canónica) como en análisis; False si otro worker ya la reclamó.
+
+    Una reclamación más antigua que `vencimiento` segundos se considera
+    abandonada y se puede volver a tomar.
+    """
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO analisis_pendientes (url) VALUES (%s)
+                ON CONFLICT (url) DO UPDATE SET iniciado_en = LOCALTIMESTAMP
+                WHERE analisis_pendientes.iniciado_en < LOCALTIMESTAMP - make_interval(secs => %s)
+                RETURNING url
+            """, (normalizar_url(url), vencimiento))
+            reclamada = cur.fetchone() is not None
+            conn.commit()
+            return reclamada
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="liberar_analisis")
+def liberar_analisis(url):
+    """Elimina la marca de análisis en curso de la URL"""
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("DELETE FROM analisis_pendientes WHERE url = %s", (normalizar_url(url),))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="encolar_trabajo")
+def encolar_trabajo(url, profundo=False):
+    """Encola el análisis de una URL; devuelve (id, estado) del trabajo.
+
+    Si la URL ya tiene un trabajo pendiente o en curso del mismo nivel se
+    devuelve ese, sin tocarlo, en lugar de crear otro.
+    """
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO trabajos (url, url_hash, profundo) VALUES (%s, %s, %s)
+                ON CONFLICT (url_hash, profundo) WHERE estado IN ('pendiente', 'en_curso')
+                DO UPDATE SET profundo = trabajos.profundo
+                RETURNING id, estado
+            """, (url, _clave(url), profundo))
+            trabajo = cur.fetchone()
+            conn.commit()
+            return trabajo
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="tomar_trabajos")
+def tomar_trabajos(limite, vencimiento):
+    """Reclama hasta `limite` trabajos listos; devuelve [(id, url, profundo, intentos)].
+
+    FOR UPDATE SKIP LOCKED reparte la cola entre workers sin que dos tomen el
+    mismo trabajo ni se esperen entre sí. Un trabajo en curso desde hace más
+    de `vencimiento` segundos (su worker murió) se vuelve a tomar.
+    """
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE trabajos
+                SET estado = 'en_curso', intentos = intentos + 1, fecha_actualizacion = LOCALTIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM trabajos
+                    WHERE (estado = 'pendiente' AND disponible_en <= LOCALTIMESTAMP)
+                       OR (estado = 'en_curso'
+                           AND fecha_actualizacion < LOCALTIMESTAMP - make_interval(secs => %s))
+                    ORDER BY disponible_en, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, url, profundo, intentos
+            """, (vencimiento, limite))
+            trabajos = cur.fetchall()
+            conn.commit()
+            return trabajos
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="terminar_trabajo")
+def terminar_trabajo(id_, intentos, error=None, reintentar_en=None, resultado=None):
+    """Cierra un trabajo tomado por un worker; devuelve False si ya no era suyo.
+
+    `intentos` es el que devolvió `tomar_trabajos`: si el trabajo venció y
+    otro worker lo volvió a tomar, el cierre se descarta. Sin `error` queda
+    completado con `resultado` (el análisis). Con `error` vuelve a la cola
+    dentro de `reintentar_en` segundos, o queda fallido si `reintentar_en`
+    es None.
+    """
+    if error is None:
+        estado, espera = TRABAJO_COMPLETADO, 0
+    elif reintentar_en is None:
+        estado, espera = TRABAJO_FALLIDO, 0
+    else:
+        estado, espera = TRABAJO_PENDIENTE, reintentar_en
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE trabajos
+                SET estado = %s, error = %s, resultado = %s, fecha_actualizacion = LOCALTIMESTAMP,
+                    disponible_en = LOCALTIMESTAMP + make_interval(secs => %s)
+                WHERE id = %s AND estado = 'en_curso' AND intentos = %s
+            """, (estado, error, json.dumps(resultado) if resultado is not None else None, espera, id_, intentos))
+            terminado = cur.rowcount == 1
+            conn.commit()
+            return terminado
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+@DURACION_BD.cronometrado(operacion="get_trabajo")
+def get_trabajo(id_):
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT id, url, profundo, estado, intentos, error, fecha_creacion, fecha_actualizacion, resultado
+                FROM trabajos WHERE id = %s
+            """, (id_,))
+            r = cur.fetchone()
+        finally:
+            cur.close()
+    if r is None:
         return None
-    finally:
-        cur.close()
-        conn.close()
+    return {
+        "trabajo_id": r[0],
+        "url": r[1],
+        "profundo": r[2],
+        "estado": r[3],
+        "intentos": r[4],
+        "error": r[5],
+        "fecha_creacion": r[6].isoformat() if r[6] else None,
+        "fecha_actualizacion": r[7].isoformat() if r[7] else None,
+        "resultado": r[8]
+    }
 
-def list_urls():
-    conn = get_connection()
-    cur = conn.cursor()
+@DURACION_BD.cronometrado(operacion="purgar_trabajos")
+def purgar_trabajos(max_edad):
+    """Borra los trabajos terminados hace más de `max_edad` segundos; devuelve cuántos"""
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                DELETE FROM trabajos
+                WHERE estado IN ('completado', 'fallido')
+                  AND fecha_actualizacion < LOCALTIMESTAMP - make_interval(secs => %s)
+            """, (max_edad,))
+            borrados = cur.rowcount
+            conn.commit()
+            return borrados
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+def es_obsoleto(analisis, max_edad=None):
+    """Indica si un análisis superó la edad máxima permitida"""
+    max_edad = ANALISIS_MAX_EDAD_SEGUNDOS if max_edad is None else max_edad
+    return time.time() - analisis.get("actualizado_en", 0) > max_edad
+
+@DURACION_BD.cronometrado(operacion="list_stale_urls")
+def list_stale_urls(max_edad=None, limite=50):
+    """URLs con análisis más antiguos que `max_edad`, empezando por los más viejos"""
+    max_edad = ANALISIS_MAX_EDAD_SEGUNDOS if max_edad is None else max_edad
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT url FROM analisis
+                WHERE fecha_actualizacion < LOCALTIMESTAMP - make_interval(secs => %s)
+                ORDER BY fecha_actualizacion ASC
+                LIMIT %s
+            """, (max_edad, limite))
+            return [r[0] for r in cur.fetchall()]
+        finally:
+            cur.close()
+
+def _codificar_cursor(fecha, id_):
+    datos = json.dumps([fecha.isoformat(), id_]).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+def _decodificar_cursor(cursor):
     try:
-        cur.execute("""
-            SELECT url, resultado, confianza, fecha_creacion 
-            FROM analisis 
-            ORDER BY fecha_creacion DESC
-        """)
-        results = cur.fetchall()
-        return [{
-            "url": r[0], 
-            "resultado": r[1], 
-            "confianza": r[2],
-            "fecha_analisis": r[3].isoformat() if r[3] else None
-        } for r in results]
-    finally:
-        cur.close()
-        conn.close()
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return datetime.fromisoformat(fecha), int(id_)
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+@DURACION_BD.cronometrado(operacion="list_urls")
+def list_urls(limite=50, cursor=None, resultado=None, confianza_min=None, confianza_max=None):
+    """Lista análisis del más reciente al más antiguo con paginación por cursor.
 
-# Inicializar la base de datos al importar
-init_db()
\ No newline at end of file
+    Devuelve (urls, siguiente_cursor); siguiente_cursor es None en la última
+    página. El cursor apunta a (fecha_creacion, id), así que cada página
+    cuesta lo mismo sin importar su profundidad.
+    """
+    condiciones = []
+    parametros = []
+    if cursor:
+        condiciones.append("(fecha_creacion, id) < (%s, %s)")
+        parametros.extend(_decodificar_cursor(cursor))
+    if resultado is not None:
+        condiciones.append("resultado = %s")
+        parametros.append(resultado)
+    if confianza_min is not None:
+        condiciones.append("confianza >= %s")
+        parametros.append(confianza_min)
+    if confianza_max is not None:
+        condiciones.append("confianza <= %s")
+        parametros.append(confianza_max)
+    where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"""
+                SELECT id, url, resultado, confianza, fecha_creacion 
+                FROM analisis 
+                {where}
+                ORDER BY fecha_creacion DESC, id DESC
+                LIMIT %s
+            """, parametros + [limite + 1])
+            results = cur.fetchall()
+        finally:
+            cur.close()
+    
+    siguiente_cursor = None
+    if len(results) > limite:
+        results = results[:limite]
+        siguiente_cursor = _codificar_cursor(results[-1][4], results[-1][0])
+    
+    return [{
+        "url": r[1], 
+        "resultado": r[2], 
+        "confianza": r[3],
+        "fecha_analisis": r[4].isoformat() if r[4] else None
+    } for r in results], siguiente_cursor
+
+@DURACION_BD.cronometrado(operacion="contar_analisis")
+def contar_analisis():
+    """Número aproximado de análisis según las estadísticas de PostgreSQL (sin recorrer la tabla)"""
+    with conexion() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'analisis'::regclass")
+            estimado = cur.fetchone()[0]
+            # -1 si la tabla nunca fue analizada por VACUUM/ANALYZE
+            return max(estimado or 0, 0)
+        finally:
+            cur.close()
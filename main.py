@@ -1,13 +1,85 @@
-from fastapi import FastAPI, HTTPException
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from db import get_analysis, save_analysis, list_urls
-from ml.predictor import predecir_ecommerce, obtener_detalles_analisis
+from db import (list_urls, contar_analisis, estadisticas_pool, ping, init_db, init_pool, close_pool,
+                encolar_trabajo, get_trabajo, TRABAJO_COMPLETADO)
+from cache import cache_veredictos
+from refresco import refrescador
+from analisis import analizar_url_async, analizar_lote, vuelos_en_curso, ejecutar_en_bd, cerrar_ejecutores
+from ml.predictor import NIVEL_PROFUNDO, calentar
+from ml.metricas import registro, PETICIONES_HTTP, ANALISIS_SERVIDOS
+from urls import normalizar_url
 import traceback
 
-app = FastAPI(title="EcomVerify API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Esquema y pool se preparan al arrancar, no al importar los módulos
+    init_db()
+    # Un único pool de conexiones para toda la vida de la aplicación
+    init_pool()
+    # Sufijos de dominio y parser cargados antes de aceptar tráfico
+    calentar()
+    refrescador.iniciar()
+    yield
+    refrescador.detener()
+    cerrar_ejecutores()
+    close_pool()
+
+app = FastAPI(title="EcomVerify API", version="1.0.0", lifespan=lifespan)
+
+# Valores leídos al exportar /metrics
+registro.funcion("ecomverify_cache_entradas", "Entradas en la caché de veredictos",
+                 lambda: cache_veredictos.estadisticas()["entradas"])
+registro.funcion("ecomverify_cache_aciertos_total", "Aciertos de la caché de veredictos",
+                 lambda: cache_veredictos.estadisticas()["aciertos"], tipo="counter")
+registro.funcion("ecomverify_cache_fallos_total", "Fallos de la caché de veredictos",
+                 lambda: cache_veredictos.estadisticas()["fallos"], tipo="counter")
+registro.funcion("ecomverify_pool_bd_en_uso", "Conexiones del pool prestadas",
+                 lambda: estadisticas_pool()["en_uso"])
+registro.funcion("ecomverify_reanalisis_pendientes", "URLs en cola de reanálisis", refrescador.pendientes)
+registro.funcion("ecomverify_analisis_en_curso", "Análisis nuevos en curso", vuelos_en_curso.en_curso)
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        respuesta = await call_next(request)
+        estado = respuesta.status_code
+        return respuesta
+    finally:
+        # La plantilla de la ruta (no la URL concreta) mantiene acotadas las series
+        ruta = request.scope.get("route")
+        PETICIONES_HTTP.observar(
+            time.perf_counter() - inicio,
+            ruta=ruta.path if ruta else "desconocida",
+            metodo=request.method,
+            estado=estado
+        )
 
 class EcommerceInput(BaseModel):
     url: str
+    # Fuerza las verificaciones completas aunque la URL ya sea claramente sospechosa
+    profundo: bool = False
+
+class LoteInput(BaseModel):
+    urls: List[str]
+    profundo: bool = False
+
+def _error_url(url):
+    """Motivo por el que la URL no se puede analizar, o None si es válida"""
+    try:
+        # La forma canónica admite el esquema en mayúsculas
+        canonica = normalizar_url(url)
+    except ValueError as e:
+        return f"URL mal formada: {e}"
+    if not canonica.startswith(('http://', 'https://')):
+        return "URL debe comenzar con http:// o https://"
+    return None
 
 class AnalysisResult(BaseModel):
     url: str
@@ -15,76 +87,170 @@ class AnalysisResult(BaseModel):
     confianza: float
     detalles: dict
     fuente: str
+    nivel_analisis: str
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"mensaje": "¡API de EcomVerify funcionando!", "version": "1.0.0"}
 
 @app.get("/urls/")
-def listar_urls():
+async def listar_urls(
+    limite: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    resultado: Optional[str] = None,
+    confianza_min: Optional[float] = Query(None, ge=0, le=1),
+    confianza_max: Optional[float] = Query(None, ge=0, le=1)
+):
     try:
-        return list_urls()
+        urls, siguiente_cursor = await ejecutar_en_bd(
+            list_urls, limite, cursor, resultado, confianza_min, confianza_max
+        )
+        return {"urls": urls, "siguiente_cursor": siguiente_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al listar URLs: {str(e)}")
 
 @app.post("/analizar/", response_model=AnalysisResult)
-def analizar_ecommerce(data: EcommerceInput):
+async def analizar_ecommerce(data: EcommerceInput):
     url = data.url
     
     # Validar URL básica
-    if not url.startswith(('http://', 'https://')):
-        raise HTTPException(status_code=400, detail="URL debe comenzar con http:// o https://")
+    error = _error_url(url)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     
     try:
-        # Verificar si ya existe en la base de datos
-        resultado_db = get_analysis(url)
-        if resultado_db:
-            print("Resultado encontrado en base de datos")
-            return {
-                "url": url,
-                "resultado": resultado_db["resultado"],
-                "confianza": resultado_db.get("confianza", 0.8),
-                "detalles": resultado_db.get("detalles", {}),
-                "fuente": "base de datos"
-            }
-        
-        # Realizar nuevo análisis con ML
-        print("Realizando nuevo análisis con ML...")
-        resultado_ml, confianza, detalles = predecir_ecommerce(url)
-        print(f"Resultado ML: {resultado_ml}, Confianza: {confianza}")
-
-        # Guardar en base de datos
-        save_analysis(url, resultado_ml, confianza, detalles)
-        print("Análisis guardado en base de datos")
-
+        analisis, fuente = await analizar_url_async(url, data.profundo)
+        detalles = analisis.get("detalles", {})
+        ANALISIS_SERVIDOS.incrementar(fuente=fuente, nivel=detalles.get("nivel_analisis", NIVEL_PROFUNDO))
         return {
             "url": url,
-            "resultado": resultado_ml,
-            "confianza": confianza,
+            "resultado": analisis["resultado"],
+            "confianza": analisis.get("confianza", 0.8),
             "detalles": detalles,
-            "fuente": "modelo ML"
+            "fuente": fuente,
+            "nivel_analisis": detalles.get("nivel_analisis", NIVEL_PROFUNDO)
         }
         
     except Exception as e:
         print(f"Error completo: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error en el análisis: {str(e)}")
 
+@app.post("/analizar/lote/")
+def analizar_ecommerce_lote(data: LoteInput):
+    """Analiza muchas URLs y devuelve una línea NDJSON por URL según van terminando"""
+    errores = {url: _error_url(url) for url in data.urls}
+    validas = [url for url, error in errores.items() if error is None]
+    
+    def generar():
+        for url, error in errores.items():
+            if error:
+                yield json.dumps({"url": url, "error": error}, ensure_ascii=False) + "\n"
+        for url, analisis, fuente in analizar_lote(validas, profundo=data.profundo):
+            if analisis is None:
+                linea = {"url": url, "error": f"Error en el análisis: {fuente}"}
+            else:
+                detalles = analisis.get("detalles", {})
+                ANALISIS_SERVIDOS.incrementar(fuente=fuente, nivel=detalles.get("nivel_analisis", NIVEL_PROFUNDO))
+                linea = {
+                    "url": url,
+                    "resultado": analisis["resultado"],
+                    "confianza": analisis.get("confianza", 0.8),
+                    "detalles": detalles,
+                    "fuente": fuente,
+                    "nivel_analisis": detalles.get("nivel_analisis", NIVEL_PROFUNDO)
+                }
+            yield json.dumps(linea, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+@app.post("/trabajos/", status_code=202)
+async def crear_trabajo(data: EcommerceInput):
+    """Encola el análisis y responde de inmediato con el id del trabajo (lo ejecuta worker.py)"""
+    url = data.url
+    error = _error_url(url)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    try:
+        trabajo_id, estado = await ejecutar_en_bd(encolar_trabajo, url, data.profundo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al encolar el análisis: {str(e)}")
+    return {"trabajo_id": trabajo_id, "url": url, "estado": estado}
+
+@app.get("/trabajos/{trabajo_id}")
+async def consultar_trabajo(trabajo_id: int):
+    """Estado de un trabajo; al completarse incluye el análisis"""
+    try:
+        trabajo = await ejecutar_en_bd(get_trabajo, trabajo_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al consultar el trabajo: {str(e)}")
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    # El análisis se guarda en el propio trabajo: con el nivel pedido y tal
+    # como quedó al terminar, aunque después se refresque
+    analisis = trabajo.pop("resultado")
+    if trabajo["estado"] == TRABAJO_COMPLETADO and analisis:
+        detalles = analisis.get("detalles", {})
+        trabajo["analisis"] = {
+            "resultado": analisis["resultado"],
+            "confianza": analisis.get("confianza", 0.8),
+            "detalles": detalles,
+            "nivel_analisis": detalles.get("nivel_analisis", NIVEL_PROFUNDO)
+        }
+    return trabajo
+
 @app.get("/estado/")
-def estado_sistema():
+async def estado_sistema():
     try:
         # Verificar conexión a BD
-        urls = list_urls()
         return {
             "estado": "operativo",
-            "urls_analizadas": len(urls),
-            "bd_conectada": True
+            "urls_analizadas": await ejecutar_en_bd(contar_analisis),
+            "bd_conectada": True,
+            "cache": cache_veredictos.estadisticas(),
+            "reanalisis_pendientes": refrescador.pendientes()
         }
     except:
         return {
             "estado": "parcialmente operativo",
-            "bd_conectada": False
+            "bd_conectada": False,
+            "cache": cache_veredictos.estadisticas()
         }
 
+@app.get("/estado/vivo")
+async def estado_vivo():
+    """Liveness: el proceso responde; no toca la base de datos"""
+    return {"estado": "vivo"}
+
+@app.get("/estado/listo")
+async def estado_listo():
+    """Readiness: la BD responde y se informa la ocupación del pool y las colas"""
+    colas = {
+        "reanalisis_pendientes": refrescador.pendientes(),
+        "analisis_en_curso": vuelos_en_curso.en_curso()
+    }
+    try:
+        await ejecutar_en_bd(ping)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={
+            "estado": "no listo",
+            "bd_conectada": False,
+            "error": str(e),
+            **colas
+        })
+    return {
+        "estado": "listo",
+        "bd_conectada": True,
+        "pool": estadisticas_pool(),
+        **colas
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return PlainTextResponse(registro.exportar(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+# Archivo SQLite de la caché de páginas (vacío para desactivarla)
+CACHE_PAGINAS_RUTA = os.getenv(
+    'CACHE_PAGINAS_RUTA', os.path.join(tempfile.gettempdir(), 'ecomverify_paginas.sqlite3')
+)
+CACHE_PAGINAS_MAX_ENTRADAS = int(os.getenv('CACHE_PAGINAS_MAX_ENTRADAS', '20000'))
+
+# Cada cuántas escrituras se recorta la caché a su tamaño máximo
+_ESCRITURAS_POR_RECORTE = 200
+
+
+def validadores(headers):
+    """ETag y Last-Modified de una respuesta (vacío si no trae ninguno)"""
+    # Las cabeceras pueden venir en un dict normal: se comparan sin mayúsculas
+    headers = {nombre.lower(): valor for nombre, valor in headers.items()}
+    encontrados = {}
+    if headers.get('etag'):
+        encontrados['etag'] = headers['etag']
+    if headers.get('last-modified'):
+        encontrados['last_modified'] = headers['last-modified']
+    return encontrados
+
+
+def cabeceras_condicionales(entrada):
+    """If-None-Match / If-Modified-Since para revalidar una entrada guardada"""
+    if not entrada:
+        return None
+    cabeceras = {}
+    if entrada.get('etag'):
+        cabeceras['If-None-Match'] = entrada['etag']
+    if entrada.get('last_modified'):
+        cabeceras['If-Modified-Since'] = entrada['last_modified']
+    return cabeceras or None
+
+
+class CachePaginas:
+    """Caché persistente (SQLite) de páginas descargadas, para peticiones condicionales.
+
+    De cada página guarda sus validadores (ETag/Last-Modified) y lo extraído
+    al parsearla (texto, enlaces, contenedores); de cada enlace sondeado, sus
+    validadores y el último estado. Un 304 permite reutilizarlos sin volver a
+    descargar ni parsear. Los errores de la caché nunca interrumpen un análisis.
+    """
+
+    def __init__(self, ruta=CACHE_PAGINAS_RUTA, max_entradas=CACHE_PAGINAS_MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self._conn = None
+        self._escrituras = 0
+        self._lock = threading.Lock()
+
+    def _conexion(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL: varios workers pueden leer mientras otro escribe
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS paginas (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    estado INTEGER NOT NULL,
+                    url_final TEXT,
+                    artefactos BLOB NOT NULL,
+                    usado_en REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sondeos (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    estado INTEGER NOT NULL,
+                    usado_en REAL NOT NULL
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _ejecutar(self, sql, parametros=()):
+        if not self.ruta:
+            return None
+        try:
+            with self._lock:
+                return self._conexion().execute(sql, parametros).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error en la caché de páginas: {e}")
+            return None
+
+    def obtener(self, url):
+        """Validadores y artefactos guardados de una página, o None"""
+        fila = self._ejecutar(
+            "SELECT etag, last_modified, estado, url_final, artefactos FROM paginas WHERE url = ?", (url,)
+        )
+        if fila is None:
+            return None
+        etag, last_modified, estado, url_final, artefactos = fila
+        try:
+            artefactos = json.loads(zlib.decompress(artefactos))
+        except (zlib.error, ValueError, TypeError) as e:
+            # Entrada corrupta o truncada: se borra y cuenta como fallo de caché
+            print(f"Entrada corrupta en la caché de páginas ({url}): {e}")
+            self._ejecutar("DELETE FROM paginas WHERE url = ?", (url,))
+            return None
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "estado": estado,
+            "url_final": url_final,
+            "artefactos": artefactos,
+        }
+
+    def guardar(self, url, validadores_pagina, estado, url_final, artefactos):
+        blob = zlib.compress(json.dumps(artefactos, ensure_ascii=False).encode('utf-8'))
+        self._ejecutar(
+            "INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, validadores_pagina.get('etag'), validadores_pagina.get('last_modified'),
+             estado, url_final, blob, time.time())
+        )
+        self._contar_escritura()
+
+    def obtener_sondeo(self, url):
+        """Validadores y último estado de un enlace sondeado, o None"""
+        fila = self._ejecutar("SELECT etag, last_modified, estado FROM sondeos WHERE url = ?", (url,))
+        if fila is None:
+            return None
+        return {"etag": fila[0], "last_modified": fila[1], "estado": fila[2]}
+
+    def guardar_sondeo(self, url, validadores_sondeo, estado):
+        self._ejecutar(
+            "INSERT OR REPLACE INTO sondeos VALUES (?, ?, ?, ?, ?)",
+            (url, validadores_sondeo.get('etag'), validadores_sondeo.get('last_modified'), estado, time.time())
+        )
+        self._contar_escritura()
+
+    def _contar_escritura(self):
+        with self._lock:
+            self._escrituras += 1
+            if self._escrituras % _ESCRITURAS_POR_RECORTE:
+                return
+        for tabla in ('paginas', 'sondeos'):
+            # Se descartan las entradas escritas hace más tiempo
+            self._ejecutar(
+                f"DELETE FROM {tabla} WHERE url IN ("
+                f"SELECT url FROM {tabla} ORDER BY usado_en DESC LIMIT -1 OFFSET ?)",
+                (self.max_entradas,)
+            )
+
+
+# Caché compartida por las descargas y los sondeos del proceso
+cache_paginas = CachePaginas()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from ml.cache_paginas import cache_paginas, cabeceras_condicionales, validadores
+from ml.metricas import CACHE_PAGINAS
+from ml.red import cliente_http, clave_host
+
+# Códigos con los que un servidor indica que no acepta HEAD
+CODIGOS_HEAD_NO_SOPORTADO = (405, 501)
+
+
+class ProbadorEnlaces:
+    """Comprueba lotes de URLs en paralelo sobre el cliente HTTP compartido.
+
+    Cada host tiene su propia cola: un sondeo solo pasa al pool cuando
+    `cliente_http` le reserva una conexión de ese host, así un host lento o
+    con muchos enlaces no ocupa los hilos que necesitan los demás. Las URLs
+    repetidas (en el mismo lote, entre verificaciones o en análisis
+    simultáneos) comparten una sola petición y su resultado se recuerda
+    `ttl` segundos.
+    """
+
+    def __init__(self, max_workers=16, timeout=3, ttl=60):
+        self.timeout = timeout
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sondeo")
+        self._en_curso = {}
+        self._resultados = {}
+        self._colas = {}
+        self._reintentos = set()
+        # RLock: el callback de un futuro ya terminado se ejecuta en el hilo que lo registra
+        self._lock = threading.RLock()
+
+    def probar(self, urls):
+        """Devuelve {url: código de estado} (None si no hubo respuesta)"""
+        futuros = {url: self._futuro(url) for url in dict.fromkeys(urls)}
+        estados = {}
+        for url, futuro in futuros.items():
+            try:
+                estados[url] = futuro.result()
+            except Exception:
+                estados[url] = None
+        return estados
+
+    def _futuro(self, url):
+        with self._lock:
+            guardado = self._resultados.get(url)
+            if guardado and guardado[0] > time.monotonic():
+                futuro = Future()
+                futuro.set_result(guardado[1])
+                return futuro
+
+            futuro = self._en_curso.get(url)
+            if futuro is not None:
+                return futuro
+            futuro = Future()
+            self._en_curso[url] = futuro
+            futuro.add_done_callback(lambda f: self._guardar(url, f))
+            host = clave_host(url)
+            self._colas.setdefault(host, deque()).append((url, futuro))
+        self._despachar(host)
+        return futuro
+
+    def _despachar(self, host):
+        """Pasa al pool los sondeos en cola del host mientras haya conexiones libres"""
+        while True:
+            with self._lock:
+                cola = self._colas.get(host)
+                if not cola:
+                    self._colas.pop(host, None)
+                    return
+                espera = cliente_http.reservar(cola[0][0])
+                if espera:
+                    break
+                url, futuro = cola.popleft()
+            self._executor.submit(self._ejecutar, host, url, futuro)
+        # Conexiones ocupadas (quizá por otras descargas) o sin turno: se reintenta
+        # más tarde, sin dormir ningún hilo del pool
+        with self._lock:
+            if host in self._reintentos:
+                return
+            self._reintentos.add(host)
+        temporizador = threading.Timer(espera, self._reintentar, (host,))
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _reintentar(self, host):
+        with self._lock:
+            self._reintentos.discard(host)
+        self._despachar(host)
+
+    def _ejecutar(self, host, url, futuro):
+        try:
+            futuro.set_result(self._sondear(url))
+        except Exception as e:
+            futuro.set_exception(e)
+        finally:
+            cliente_http.liberar(url)
+            self._despachar(host)
+
+    def _guardar(self, url, futuro):
+        with self._lock:
+            self._en_curso.pop(url, None)
+            if futuro.exception() is not None:
+                return
+            ahora = time.monotonic()
+            if len(self._resultados) > 1000:
+                self._resultados = {u: r for u, r in self._resultados.items() if r[0] > ahora}
+            self._resultados[url] = (ahora + self.ttl, futuro.result())
+
+    def _sondear(self, url):
+        # HEAD condicional: un 304 confirma el último estado guardado del enlace
+        anterior = cache_paginas.obtener_sondeo(url)
+        resp = cliente_http.head(url, self.timeout, headers=cabeceras_condicionales(anterior), reservado=True)
+        if resp.status_code == 304 and anterior is not None:
+            CACHE_PAGINAS.incrementar(tipo="sondeo", resultado="304")
+            return anterior["estado"]
+        CACHE_PAGINAS.incrementar(tipo="sondeo", resultado="descarga")
+        if resp.status_code not in CODIGOS_HEAD_NO_SOPORTADO:
+            validadores_sondeo = validadores(resp.headers)
+            if resp.status_code == 200 and validadores_sondeo:
+                cache_paginas.guardar_sondeo(url, validadores_sondeo, resp.status_code)
+            return resp.status_code
+
+        # El servidor rechaza HEAD: pedir solo el primer byte
+        resp = cliente_http.get(url, self.timeout, headers={'Range': 'bytes=0-0'}, leer_cuerpo=False, reservado=True)
+        if resp.status_code in (206, 416):
+            return 200
+        return resp.status_code
+
+
+# Probador compartido por todas las verificaciones del proceso
+probador_enlaces = ProbadorEnlaces()
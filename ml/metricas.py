@@ -0,0 +1,199 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES_POR_DEFECTO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _etiquetas_texto(etiquetas):
+    if not etiquetas:
+        return ''
+    partes = []
+    for nombre, valor in etiquetas:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Contador:
+    """Contador monótono, con una serie por combinación de etiquetas"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, cantidad=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, **etiquetas):
+        with self._lock:
+            return self._valores.get(tuple(sorted(etiquetas.items())), 0)
+
+    def lineas(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f'{self.nombre}{_etiquetas_texto(etiquetas)} {_numero(valor)}'
+
+
+class Histograma:
+    """Distribución de duraciones (segundos) en cubetas acumuladas, como en Prometheus"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, limites=LIMITES_POR_DEFECTO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = tuple(sorted(limites))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, segundos, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [conteo por cubeta..., suma, total]
+                serie = self._series[clave] = [0] * len(self.limites) + [0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if segundos <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += segundos
+            serie[-1] += 1
+
+    @contextmanager
+    def cronometro(self, **etiquetas):
+        """Mide el bloque y lo observa al salir, también si lanza una excepción.
+
+        Devuelve una Medicion cuyo atributo `segundos` queda disponible al salir.
+        """
+        medicion = Medicion()
+        try:
+            yield medicion
+        finally:
+            medicion.segundos = time.perf_counter() - medicion.inicio
+            self.observar(medicion.segundos, **etiquetas)
+
+    def cronometrado(self, **etiquetas):
+        """Decorador equivalente a envolver la función en `cronometro`"""
+        def decorador(funcion):
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.cronometro(**etiquetas):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def lineas(self):
+        with self._lock:
+            series = [(etiquetas, list(serie)) for etiquetas, serie in self._series.items()]
+        for etiquetas, serie in series:
+            acumulado = 0
+            for limite, conteo in zip(self.limites, serie):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{_etiquetas_texto(etiquetas + (("le", _numero(limite)),))} {acumulado}'
+            yield f'{self.nombre}_bucket{_etiquetas_texto(etiquetas + (("le", "+Inf"),))} {serie[-1]}'
+            yield f'{self.nombre}_sum{_etiquetas_texto(etiquetas)} {_numero(serie[-2])}'
+            yield f'{self.nombre}_count{_etiquetas_texto(etiquetas)} {serie[-1]}'
+
+
+class Medicion:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.segundos = None
+
+    @property
+    def ms(self):
+        return round(self.segundos * 1000, 1)
+
+
+class Funcion:
+    """Valor leído en el momento de exportar (tamaño de colas, estado del pool...)"""
+
+    def __init__(self, nombre, ayuda, funcion, tipo='gauge'):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def lineas(self):
+        try:
+            valor = self.funcion()
+        except Exception:
+            return
+        yield f'{self.nombre} {_numero(valor)}'
+
+
+class RegistroMetricas:
+    """Métricas del proceso, exportables en el formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        with self._lock:
+            return self._metricas.setdefault(metrica.nombre, metrica)
+
+    def contador(self, nombre, ayuda):
+        return self._registrar(Contador(nombre, ayuda))
+
+    def histograma(self, nombre, ayuda, limites=LIMITES_POR_DEFECTO):
+        return self._registrar(Histograma(nombre, ayuda, limites))
+
+    def funcion(self, nombre, ayuda, funcion, tipo='gauge'):
+        with self._lock:
+            self._metricas[nombre] = Funcion(nombre, ayuda, funcion, tipo)
+
+    def exportar(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.lineas())
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro compartido por todo el proceso
+registro = RegistroMetricas()
+
+# Métricas de la aplicación
+PETICIONES_HTTP = registro.histograma(
+    'ecomverify_http_peticion_segundos', 'Duración de las peticiones a la API por ruta, método y estado')
+ANALISIS_SERVIDOS = registro.contador(
+    'ecomverify_analisis_total', 'Análisis servidos por fuente (cache, base de datos, modelo ML) y nivel')
+DURACION_BD = registro.histograma(
+    'ecomverify_bd_segundos', 'Duración de las operaciones de base de datos por operación')
+DURACION_DESCARGA = registro.histograma(
+    'ecomverify_descarga_segundos', 'Duración de las peticiones HTTP salientes por método')
+ERRORES_DESCARGA = registro.contador(
+    'ecomverify_descarga_errores_total', 'Peticiones HTTP salientes fallidas por método')
+HOSTS_INALCANZABLES = registro.contador(
+    'ecomverify_descarga_host_inalcanzable_total', 'Peticiones descartadas sin conectar por host marcado como inalcanzable')
+CACHE_PAGINAS = registro.contador(
+    'ecomverify_cache_paginas_total', 'Peticiones condicionales por tipo (pagina, sondeo) y resultado (304 o descarga)')
+DURACION_PARSEO = registro.histograma(
+    'ecomverify_parseo_segundos', 'Duración del parseo HTML por tipo (completo o solo enlaces)')
+DURACION_VERIFICACION = registro.histograma(
+    'ecomverify_verificacion_segundos', 'Duración de cada verificación del sitio')
+ERRORES_VERIFICACION = registro.contador(
+    'ecomverify_verificacion_errores_total', 'Verificaciones que fallaron y devolvieron su resultado por defecto')
+TIMEOUTS_VERIFICACION = registro.contador(
+    'ecomverify_verificacion_timeouts_total', 'Verificaciones que no terminaron dentro del plazo global')
+DURACION_PREDICCION = registro.histograma(
+    'ecomverify_prediccion_segundos', 'Duración de predecir_ecommerce por nivel de análisis')
@@ -0,0 +1,203 @@
+import os
+import threading
+from bs4 import BeautifulSoup, CData, NavigableString, SoupStrainer, Tag
+
+from ml.cache_paginas import cache_paginas, cabeceras_condicionales, validadores
+from ml.metricas import CACHE_PAGINAS, DURACION_PARSEO
+from ml.red import cliente_http
+
+try:
+    import lxml  # noqa: F401
+    PARSER_POR_DEFECTO = 'lxml'
+except ImportError:
+    PARSER_POR_DEFECTO = 'html.parser'
+
+# Backend de BeautifulSoup: lxml (en C) si está instalado, si no el parser de la stdlib
+PARSER_HTML = os.getenv('PARSER_HTML', PARSER_POR_DEFECTO)
+
+# Tipos de texto que cuenta get_text() (ni comentarios, ni <script>, ni <style>)
+TIPOS_TEXTO = (NavigableString, CData)
+# Etiquetas que pueden contener secciones de comentarios
+ETIQUETAS_CONTENEDORAS = ('div', 'section', 'article')
+
+
+class PaginaNoDisponible(Exception):
+    """La página no se pudo descargar o procesar"""
+
+
+class PaginaSnapshot:
+    """Descarga y parsea una página una sola vez para compartirla entre verificaciones.
+
+    Tras el parseo solo se conserva una estructura compacta (texto, enlaces y
+    tramos de los contenedores); el árbol y el HTML se descartan. Si solo se
+    piden los enlaces, se parsean únicamente los <a href>. Las páginas con
+    ETag o Last-Modified guardan esa estructura en `cache_paginas` al parsearse.
+    """
+
+    def __init__(self, url, status_code=None, url_final=None, headers=None, html=b"",
+                 encoding=None, error=None, tiempo_descarga_ms=0.0):
+        self.url = url
+        self.status_code = status_code
+        self.url_final = url_final or url
+        self.headers = headers or {}
+        self.error = error
+        self.tiempo_descarga_ms = tiempo_descarga_ms
+        self.bytes_descargados = len(html)
+        self.tiempo_parseo_ms = 0.0
+        # True si el servidor respondió 304 y la estructura viene de cache_paginas
+        self.revalidada = False
+        self._html = html
+        self._encoding = encoding
+        self._texto = None
+        self._texto_lower = None
+        self._enlaces = None
+        self._contenedores = None
+        # Las verificaciones leen el snapshot en paralelo: el parseo perezoso se hace una sola vez
+        self._lock = threading.RLock()
+
+    @classmethod
+    def desde_cache(cls, url, entrada, tiempo_descarga_ms=0.0):
+        """Snapshot ya parseado a partir de una entrada revalidada de `cache_paginas`"""
+        pagina = cls(url, status_code=entrada["estado"], url_final=entrada["url_final"],
+                     tiempo_descarga_ms=tiempo_descarga_ms)
+        artefactos = entrada["artefactos"]
+        pagina._texto = artefactos["texto"]
+        pagina._texto_lower = artefactos["texto_lower"]
+        pagina._enlaces = [tuple(enlace) for enlace in artefactos["enlaces"]]
+        pagina._contenedores = [tuple(contenedor) for contenedor in artefactos["contenedores"]]
+        pagina.revalidada = True
+        return pagina
+
+    def verificar(self):
+        """Lanza PaginaNoDisponible si la descarga falló"""
+        if self.error is not None:
+            raise PaginaNoDisponible(self.error)
+
+    def _parsear(self, solo=None):
+        # Sin charset en las cabeceras, BeautifulSoup lo detecta (incluido <meta charset>)
+        return BeautifulSoup(self._html, PARSER_HTML, from_encoding=self._encoding, parse_only=solo)
+
+    def parsear(self):
+        """Parsea el documento completo una sola vez y guarda la estructura compacta"""
+        self.verificar()
+        with self._lock:
+            if self._texto is None:
+                with DURACION_PARSEO.cronometro(tipo="completo") as medicion:
+                    self._recorrer(self._parsear())
+                self._html = None
+                self.tiempo_parseo_ms += medicion.ms
+                self._guardar_en_cache()
+
+    def _guardar_en_cache(self):
+        validadores_pagina = validadores(self.headers)
+        if self.status_code != 200 or not validadores_pagina:
+            return
+        cache_paginas.guardar(self.url, validadores_pagina, self.status_code, self.url_final, {
+            "texto": self._texto,
+            "texto_lower": self._texto_lower,
+            "enlaces": self._enlaces,
+            "contenedores": self._contenedores,
+        })
+
+    def _recorrer(self, soup):
+        """Recorre el DOM una sola vez para obtener el texto, los enlaces y los tramos de cada contenedor.
+
+        El texto de cada contenedor o enlace es el tramo [inicio, fin) de
+        `texto_lower`, así no se vuelve a serializar el texto de los nodos anidados.
+        """
+        partes = []
+        partes_lower = []
+        contenedores = []
+        enlaces = []
+        posicion = 0
+        pila = [(iter(soup.contents), None, None)]
+        while pila:
+            hijos, contenedor, enlace = pila[-1]
+            hijo = next(hijos, None)
+            if hijo is None:
+                pila.pop()
+                if contenedor is not None:
+                    contenedor[3] = posicion
+                if enlace is not None:
+                    enlace[2] = posicion
+            elif isinstance(hijo, Tag):
+                contenedor = enlace = None
+                if hijo.name in ETIQUETAS_CONTENEDORAS:
+                    contenedor = [
+                        str(hijo.get('class', [])).lower(),
+                        hijo.get('id', '').lower(),
+                        posicion,
+                        None
+                    ]
+                    contenedores.append(contenedor)
+                elif hijo.name == 'a' and hijo.get('href') is not None:
+                    enlace = [hijo['href'].lower(), posicion, None]
+                    enlaces.append(enlace)
+                pila.append((iter(hijo.contents), contenedor, enlace))
+            elif type(hijo) in TIPOS_TEXTO:
+                partes.append(hijo)
+                # Se baja a minúsculas por trozo para que los tramos coincidan con texto_lower
+                partes_lower.append(hijo.lower())
+                posicion += len(partes_lower[-1])
+        self._texto = ''.join(partes)
+        self._texto_lower = ''.join(partes_lower)
+        self._contenedores = [tuple(contenedor) for contenedor in contenedores]
+        self._enlaces = [(href, self._texto_lower[inicio:fin]) for href, inicio, fin in enlaces]
+
+    @property
+    def texto(self):
+        self.parsear()
+        return self._texto
+
+    @property
+    def texto_lower(self):
+        self.parsear()
+        return self._texto_lower
+
+    @property
+    def contenedores(self):
+        """Lista de (class, id, inicio, fin) de cada div/section/article, en minúsculas"""
+        self.parsear()
+        return self._contenedores
+
+    @property
+    def enlaces(self):
+        """Lista de (href, texto) en minúsculas de todos los <a href>"""
+        self.verificar()
+        with self._lock:
+            if self._enlaces is None:
+                # Solo hacen falta los enlaces: parsear únicamente los <a href>
+                with DURACION_PARSEO.cronometro(tipo="enlaces") as medicion:
+                    soup = self._parsear(SoupStrainer('a', href=True))
+                    self._enlaces = [
+                        (link['href'].lower(), link.get_text().lower())
+                        for link in soup.find_all('a', href=True)
+                    ]
+                self.tiempo_parseo_ms += medicion.ms
+        return self._enlaces
+
+
+def descargar_pagina(url: str, timeout: float = 8):
+    """Descarga la página una vez; los errores quedan registrados en el snapshot.
+
+    Si hay una copia en `cache_paginas` se pide de forma condicional y un 304
+    devuelve la estructura guardada sin descargar ni parsear el HTML.
+    """
+    try:
+        entrada = cache_paginas.obtener(url)
+        response = cliente_http.get(url, timeout, headers=cabeceras_condicionales(entrada))
+        if response.status_code == 304 and entrada is not None:
+            CACHE_PAGINAS.incrementar(tipo="pagina", resultado="304")
+            return PaginaSnapshot.desde_cache(url, entrada, tiempo_descarga_ms=response.tiempo_ms)
+        CACHE_PAGINAS.incrementar(tipo="pagina", resultado="descarga")
+        return PaginaSnapshot(
+            url,
+            status_code=response.status_code,
+            url_final=response.url,
+            headers=dict(response.headers),
+            html=response.contenido,
+            encoding=response.encoding,
+            tiempo_descarga_ms=response.tiempo_ms
+        )
+    except Exception as e:
+        return PaginaSnapshot(url, error=str(e))
@@ -0,0 +1,68 @@
+import re
+from collections import Counter
+
+
+def _regex_trie(patrones):
+    """Expresión regular equivalente a un trie de los patrones.
+
+    En cada posición coincide con el patrón más largo que empieza ahí: las
+    ramas de un nodo empiezan por caracteres distintos y los sufijos
+    opcionales son codiciosos.
+    """
+    trie = {}
+    for patron in patrones:
+        nodo = trie
+        for caracter in patron:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = {}
+
+    def construir(nodo):
+        ramas = [re.escape(c) + construir(hijo) for c, hijo in sorted(nodo.items()) if c != '']
+        if not ramas:
+            return ''
+        cuerpo = ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+        if '' in nodo:
+            cuerpo = '(?:' + cuerpo + ')?'
+        return cuerpo
+
+    return construir(trie)
+
+
+class BuscadorPatrones:
+    """Busca muchas subcadenas a la vez recorriendo el texto una sola vez.
+
+    Equivale a evaluar `patron in texto` para cada patrón, incluidas las
+    coincidencias solapadas (p. ej. "demanda" dentro de "demandar").
+    """
+
+    def __init__(self, patrones):
+        self.patrones = list(dict.fromkeys(patrones))
+        # Lookahead: encuentra una coincidencia en cada posición aunque se solapen
+        self._regex = re.compile('(?=(' + _regex_trie(self.patrones) + '))')
+        # Patrones que también empiezan en la posición de cada coincidencia más larga
+        self._prefijos = {
+            patron: [otro for otro in self.patrones if patron.startswith(otro)]
+            for patron in self.patrones
+        }
+
+    def contar(self, texto):
+        """Número de apariciones de cada patrón presente en el texto"""
+        conteo = Counter()
+        for patron in self._regex.findall(texto):
+            conteo.update(self._prefijos[patron])
+        return conteo
+
+    def posiciones(self, texto):
+        """(inicio, fin, patrón) de cada aparición, ordenadas por inicio"""
+        for coincidencia in self._regex.finditer(texto):
+            inicio = coincidencia.start()
+            for patron in self._prefijos[coincidencia.group(1)]:
+                yield inicio, inicio + len(patron), patron
+
+    def encontrados(self, texto):
+        """Patrones presentes en el texto, en el orden en que se definieron"""
+        conteo = self.contar(texto)
+        return [patron for patron in self.patrones if patron in conteo]
+
+    def contiene_alguno(self, texto):
+        return self._regex.search(texto) is not None
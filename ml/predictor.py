@@ -1,8 +1,18 @@
 import re
+import os
+import copy
+from collections import Counter
+import time
+from bisect import bisect_left
 import tldextract
-import joblib
-from urllib.parse import urlparse
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urljoin
+from ml.pagina import descargar_pagina, PaginaSnapshot
+from ml.enlaces import probador_enlaces
+from ml.red import cliente_http
+from ml.patrones import BuscadorPatrones
+from ml.metricas import (DURACION_VERIFICACION, ERRORES_VERIFICACION, TIMEOUTS_VERIFICACION,
+                         DURACION_PREDICCION)
 
 # Palabras sospechosas comunes en ecommerce piratas
 PALABRAS_SOSPECHOSAS = [
@@ -11,32 +21,251 @@ PALABRAS_SOSPECHOSAS = [
     "liquidacion", "rebaja", "promocion", "gang", "chollo"
 ]
 
-def extraer_features(url: str):
-    """Extrae características de la URL para el modelo"""
-    parsed_url = urlparse(url)
+# Patrones comunes de URLs de términos y condiciones
+PATRONES_TERMINOS = [
+    "/terminos",
+    "/terminos-y-condiciones", 
+    "/terms",
+    "/terms-and-conditions",
+    "/legal",
+    "/privacidad",
+    "/privacy"
+]
+
+# Términos que indican quejas o problemas
+TERMINOS_QUEJAS = [
+    "estafa", "fraude", "engaño", "mentira", "no funciona", 
+    "no llega", "no recibo", "robo", "timó", "timaron",
+    "queja", "reclamo", "demanda", "demandar", "demandado",
+    "problema", "error", "falla", "defectuoso", "mal estado",
+    "no responde", "no contestan", "atención al cliente pésima",
+    "devolución", "reembolso", "arrepentimiento"
+]
+
+# Patrones que indican sección de comentarios (en class/id o en el texto)
+PATRONES_COMENTARIOS = ['comment', 'review', 'rating', 'testimonial', 'reseña', 'comentario']
+FRASES_COMENTARIOS = ['deja tu comentario', 'escribe tu reseña']
+
+# Enlaces críticos que deben funcionar
+PATRONES_ENLACES_CRITICOS = [
+    'contacto', 'contact', 'about', 'nosotros', 'soporte', 
+    'help', 'ayuda', 'terminos', 'terms', 'privacidad', 'privacy',
+    'devolucion', 'return', 'garantia', 'warranty'
+]
+
+PATRONES_CONTACTO = ['contacto', 'contact', 'about', 'nosotros', 'soporte']
+
+# Entidades reguladoras comunes
+ENTIDADES_REGULADORAS = {
+    "defensa_consumidor": ["defensa al consumidor", "proconsumo", "derechos del consumidor"],
+    "camara_comercio": ["cámara de comercio", "registro mercantil"],
+    "superintendencia": ["superintendencia", "supersociedades", "superfinanciera"],
+    "reclamos": ["libro de reclamaciones", "sistema de reclamos"],
+    "certificaciones": ["ssl", "https", "certificado", "verisign", "digicert"]
+}
+
+# Buscadores precompilados: cada texto se recorre una sola vez para todas sus palabras clave
+BUSCADOR_SOSPECHOSAS = BuscadorPatrones(PALABRAS_SOSPECHOSAS)
+BUSCADOR_TERMINOS = BuscadorPatrones(PATRONES_TERMINOS)
+BUSCADOR_QUEJAS = BuscadorPatrones(TERMINOS_QUEJAS)
+BUSCADOR_COMENTARIOS = BuscadorPatrones(PATRONES_COMENTARIOS)
+BUSCADOR_FRASES_COMENTARIOS = BuscadorPatrones(FRASES_COMENTARIOS)
+BUSCADOR_ENLACES_CRITICOS = BuscadorPatrones(PATRONES_ENLACES_CRITICOS)
+BUSCADOR_CONTACTO = BuscadorPatrones(PATRONES_CONTACTO)
+BUSCADOR_ENTIDADES = BuscadorPatrones(
+    palabra for palabras in ENTIDADES_REGULADORAS.values() for palabra in palabras
+)
+
+# Extractor de dominios con la lista de sufijos públicos que trae tldextract:
+# sin descargas ni caché en disco, el resultado no depende de la red
+EXTRACTOR_DOMINIOS = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+# Expresiones de las características de la URL
+_RE_CARACTER_ESPECIAL = re.compile(r'[^a-zA-Z0-9.-]')
+_RE_IP = re.compile(r'^\d+\.\d+\.\d+\.\d+$')
+_RE_DIGITO = re.compile(r'\d')
+
+# Columnas de extraer_features / extraer_features_lote, en orden
+NOMBRES_FEATURES = [
+    "longitud_url", "longitud_dominio", "tiene_https", "num_palabras_sospechosas",
+    "num_caracteres_especiales", "tiene_ip", "edad_dominio_simulada", "ratio_numeros"
+]
+
+# Riesgo a partir del cual el veredicto es "pirata"
+UMBRAL_RIESGO = 0.3
+
+# Nivel de análisis que produjo un veredicto (detalles["nivel_analisis"])
+NIVEL_LEXICO = "lexico"
+NIVEL_PROFUNDO = "profundo"
+
+# Máximo de enlaces críticos que se sondean por análisis
+MAX_ENLACES_CRITICOS = 15
+
+# Plazo global (segundos) para descargar la página y ejecutar todas las verificaciones
+ANALISIS_TIMEOUT = float(os.getenv("ANALISIS_TIMEOUT", "15"))
+
+# Incluir en `detalles["tiempos_ms"]` el desglose de tiempos de cada análisis
+DETALLES_TIEMPOS = os.getenv("DETALLES_TIEMPOS", "0").lower() in ("1", "true", "si", "sí")
+
+# Resultados usados cuando una verificación falla o no termina dentro del plazo
+RESULTADOS_POR_DEFECTO = {
+    "terminos_condiciones": {
+        "tiene_terminos": False,
+        "enlaces_encontrados": [],
+        "puntuacion": 0.1,
+        "enlaces_funcionando": 0,
+        "tiene_terminos_funcionales": False
+    },
+    "entidades_reguladoras": {"menciones_entidades": {}, "puntuacion": 0.1, "total_menciones": 0},
+    "informacion_contacto": {"tiene_direccion": False, "tiene_telefono": False, "tiene_email": False, "enlaces_contacto": [], "puntuacion": 0.1},
+    "comentarios_quejas": {
+        "quejas_detectadas": [],
+        "total_quejas": 0,
+        "secciones_comentarios": [],
+        "tiene_comentarios_negativos": False,
+        "puntuacion_riesgo": 0.0
+    },
+    "enlaces_rotos": {
+        "enlaces_importantes": [],
+        "enlaces_rotos": [],
+        "total_enlaces_rotos": 0,
+        "tiene_enlaces_rotos": False,
+        "puntuacion_riesgo": 0.0
+    }
+}
+
+def resultado_por_defecto(nombre: str):
+    """Copia independiente del resultado por defecto de una verificación"""
+    return copy.deepcopy(RESULTADOS_POR_DEFECTO[nombre])
+
+def calentar():
+    """Carga lo que el primer análisis pagaría en frío (lista de sufijos, parser HTML).
+
+    Pensado para llamarse antes de que el worker acepte tráfico.
+    """
+    extraer_features("https://www.ejemplo.com.co/tienda")
+    pagina = PaginaSnapshot("https://www.ejemplo.com.co/", html=b"<html><body><a href='/'>x</a></body></html>")
+    pagina.parsear()
+
+def _features_dominio(parsed_url, url):
+    """Características que dependen solo del host: (longitud, especiales, ip, edad simulada)"""
     dominio = parsed_url.netloc.lower()
-    path = parsed_url.path.lower()
     
     # Extraer información del dominio
-    ext = tldextract.extract(url)
-    subdominio = ext.subdomain
+    ext = EXTRACTOR_DOMINIOS(url)
     dominio_principal = ext.domain
-    tld = ext.suffix
+    
+    return (
+        len(dominio),
+        len(_RE_CARACTER_ESPECIAL.findall(dominio)),
+        1 if _RE_IP.match(dominio) else 0,
+        min(len(dominio_principal) / 10, 1.0),  # Simulación
+    )
+
+def _features_url(url: str, parsed_url, features_dominio):
+    longitud_dominio, caracteres_especiales, tiene_ip, edad_dominio = features_dominio
     
     # Características
     features = {
         "longitud_url": len(url),
-        "longitud_dominio": len(dominio),
+        "longitud_dominio": longitud_dominio,
         "tiene_https": 1 if parsed_url.scheme == "https" else 0,
-        "num_palabras_sospechosas": sum(1 for palabra in PALABRAS_SOSPECHOSAS if palabra in url.lower()),
-        "num_caracteres_especiales": len(re.findall(r'[^a-zA-Z0-9.-]', dominio)),
-        "tiene_ip": 1 if re.match(r'^\d+\.\d+\.\d+\.\d+$', dominio) else 0,
-        "edad_dominio_simulada": min(len(dominio_principal) / 10, 1.0),  # Simulación
-        "ratio_numeros": len(re.findall(r'\d', url)) / len(url) if len(url) > 0 else 0,
+        "num_palabras_sospechosas": len(BUSCADOR_SOSPECHOSAS.contar(url.lower())),
+        "num_caracteres_especiales": caracteres_especiales,
+        "tiene_ip": tiene_ip,
+        "edad_dominio_simulada": edad_dominio,
+        "ratio_numeros": len(_RE_DIGITO.findall(url)) / len(url) if len(url) > 0 else 0,
     }
     
     return list(features.values())
 
+def extraer_features(url: str):
+    """Extrae características de la URL para el modelo"""
+    parsed_url = urlsplit(url)
+    return _features_url(url, parsed_url, _features_dominio(parsed_url, url))
+
+def extraer_features_lote(urls):
+    """Matriz (n, 8) con las mismas columnas que `extraer_features` para cada URL.
+
+    Las características del dominio se calculan una sola vez por host del lote.
+    """
+    import numpy as np  # solo el triage por lotes usa numpy: se carga al necesitarlo
+    
+    por_host = {}
+    filas = []
+    for url in urls:
+        parsed_url = urlsplit(url)
+        # Sin esquema no hay netloc y tldextract toma el host de la propia URL
+        clave = (parsed_url.netloc, None if parsed_url.netloc else url)
+        features_dominio = por_host.get(clave)
+        if features_dominio is None:
+            features_dominio = por_host[clave] = _features_dominio(parsed_url, url)
+        filas.append(_features_url(url, parsed_url, features_dominio))
+    return np.array(filas, dtype=float).reshape(len(filas), len(NOMBRES_FEATURES))
+
+def calcular_riesgo_url(features: list):
+    """Riesgo base (0-1) a partir solo de las características de la URL"""
+    # Obtener valores individuales para mejor legibilidad
+    palabras_sospechosas = features[3]
+    caracteres_especiales = features[4]
+    tiene_https = features[2]
+    tiene_ip = features[5]
+    ratio_numeros = features[7]
+    
+    riesgo = 0.0
+    
+    if palabras_sospechosas >= 3:
+        riesgo += 0.4
+    elif palabras_sospechosas == 2:
+        riesgo += 0.2
+    elif palabras_sospechosas == 1:
+        riesgo += 0.1
+    
+    if tiene_https == 0:
+        riesgo += 0.3
+    
+    if tiene_ip == 1:
+        riesgo += 0.3
+    
+    if caracteres_especiales >= 4:
+        riesgo += 0.2
+    elif caracteres_especiales >= 2:
+        riesgo += 0.1
+    
+    if ratio_numeros > 0.25:
+        riesgo += 0.2
+    elif ratio_numeros > 0.15:
+        riesgo += 0.1
+    
+    return riesgo
+
+def calcular_riesgo_url_lote(features):
+    """Versión vectorizada de `calcular_riesgo_url` sobre una matriz de `extraer_features_lote`"""
+    import numpy as np
+    
+    features = np.asarray(features, dtype=float)
+    palabras_sospechosas = features[:, 3]
+    caracteres_especiales = features[:, 4]
+    tiene_https = features[:, 2]
+    tiene_ip = features[:, 5]
+    ratio_numeros = features[:, 7]
+    
+    # Mismos pesos y mismo orden de suma que la versión escalar
+    riesgo = np.select(
+        [palabras_sospechosas >= 3, palabras_sospechosas == 2, palabras_sospechosas == 1],
+        [0.4, 0.2, 0.1], 0.0
+    )
+    riesgo += np.where(tiene_https == 0, 0.3, 0.0)
+    riesgo += np.where(tiene_ip == 1, 0.3, 0.0)
+    riesgo += np.select([caracteres_especiales >= 4, caracteres_especiales >= 2], [0.2, 0.1], 0.0)
+    riesgo += np.select([ratio_numeros > 0.25, ratio_numeros > 0.15], [0.2, 0.1], 0.0)
+    return riesgo
+
+def evaluar_urls_lote(urls):
+    """Triage sin descargas: devuelve (matriz de características, riesgo base de cada URL)"""
+    features = extraer_features_lote(urls)
+    return features, calcular_riesgo_url_lote(features)
+
 def obtener_detalles_analisis(url: str, features: list):
     """Genera detalles explicativos más detallados del análisis"""
     detalles = {
@@ -94,32 +323,23 @@ def obtener_detalles_analisis(url: str, features: list):
     
     return detalles
 
-def verificar_terminos_condiciones(url: str):
+def _base_enlaces(url, pagina):
+    """URL contra la que se resuelven los enlaces relativos: la final, tras las redirecciones"""
+    if pagina is not None and pagina.error is None:
+        return pagina.url_final
+    return url
+
+def verificar_terminos_condiciones(url: str, pagina=None):
     """Verifica si el sitio tiene términos y condiciones accesibles"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        
-        # Patrones comunes de URLs de términos y condiciones
-        terminos_patterns = [
-            "/terminos",
-            "/terminos-y-condiciones", 
-            "/terms",
-            "/terms-and-conditions",
-            "/legal",
-            "/privacidad",
-            "/privacy"
-        ]
-        
         # Intentar acceder a la página principal
-        response = requests.get(url, timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.text, 'html.parser')
+        pagina = pagina or descargar_pagina(url, timeout=5)
+        pagina.verificar()
         
         # Buscar enlaces a términos y condiciones
         terminos_links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href'].lower()
-            if any(pattern in href for pattern in terminos_patterns):
+        for href, _ in pagina.enlaces:
+            if BUSCADOR_TERMINOS.contiene_alguno(href):
                 terminos_links.append(href)
         
         return {
@@ -129,50 +349,44 @@ def verificar_terminos_condiciones(url: str):
         }
         
     except Exception:
+        ERRORES_VERIFICACION.incrementar(verificacion="terminos_condiciones")
         return {"tiene_terminos": False, "enlaces_encontrados": [], "puntuacion": 0.3}
-def verificar_comentarios_quejas(url: str):
+
+def _apariciones_en_tramo(apariciones, inicios, inicio, fin):
+    """Patrones de las apariciones (ordenadas por inicio) contenidas por completo en [inicio, fin)"""
+    for indice in range(bisect_left(inicios, inicio), len(apariciones)):
+        inicio_aparicion, fin_aparicion, patron = apariciones[indice]
+        if inicio_aparicion >= fin:
+            break
+        if fin_aparicion <= fin:
+            yield patron
+
+def verificar_comentarios_quejas(url: str, pagina=None):
     """Verifica si hay comentarios o quejas de usuarios"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        import re
-        
-        # Términos que indican quejas o problemas
-        terminos_quejas = [
-            "estafa", "fraude", "engaño", "mentira", "no funciona", 
-            "no llega", "no recibo", "robo", "timó", "timaron",
-            "queja", "reclamo", "demanda", "demandar", "demandado",
-            "problema", "error", "falla", "defectuoso", "mal estado",
-            "no responde", "no contestan", "atención al cliente pésima",
-            "devolución", "reembolso", "arrepentimiento"
-        ]
-        
-        response = requests.get(url, timeout=8, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text().lower()
-        
-        # Buscar quejas en el texto
-        quejas_encontradas = []
-        for queja in terminos_quejas:
-            if queja in text:
-                quejas_encontradas.append(queja)
-        
-        # Buscar en secciones de comentarios o reseñas
+        pagina = pagina or descargar_pagina(url, timeout=8)
+        text = pagina.texto_lower
+        
+        # Buscar quejas en el texto (una sola pasada para todos los términos)
+        quejas = list(BUSCADOR_QUEJAS.posiciones(text))
+        frases = list(BUSCADOR_FRASES_COMENTARIOS.posiciones(text))
+        conteo_quejas = Counter(queja for _, _, queja in quejas)
+        quejas_encontradas = [queja for queja in TERMINOS_QUEJAS if queja in conteo_quejas]
+        
+        # Buscar en secciones de comentarios o reseñas: el texto de cada
+        # contenedor es un tramo del texto de la página, sin volver a recorrerlo
+        inicios_quejas = [inicio for inicio, _, _ in quejas]
+        inicios_frases = [inicio for inicio, _, _ in frases]
         secciones_comentarios = []
-        for element in soup.find_all(['div', 'section', 'article']):
-            class_list = element.get('class', [])
-            id_attr = element.get('id', '')
-            text_content = element.get_text().lower()
-            
-            # Patrones que indican sección de comentarios
-            patrones_comentarios = ['comment', 'review', 'rating', 'testimonial', 'reseña', 'comentario']
-            
-            if (any(p in str(class_list).lower() for p in patrones_comentarios) or
-                any(p in id_attr.lower() for p in patrones_comentarios) or
-                any(p in text_content for p in ['deja tu comentario', 'escribe tu reseña'])):
+        for class_list, id_attr, inicio, fin in pagina.contenedores:
+            if (BUSCADOR_COMENTARIOS.contiene_alguno(class_list) or
+                BUSCADOR_COMENTARIOS.contiene_alguno(id_attr) or
+                any(True for _ in _apariciones_en_tramo(frases, inicios_frases, inicio, fin))):
                 
                 # Contar comentarios negativos en esta sección
-                comentarios_negativos = sum(1 for q in terminos_quejas if q in text_content)
+                comentarios_negativos = len({
+                    queja for queja in _apariciones_en_tramo(quejas, inicios_quejas, inicio, fin)
+                })
                 if comentarios_negativos > 0:
                     secciones_comentarios.append({
                         'tipo': 'seccion_comentarios',
@@ -182,82 +396,73 @@ def verificar_comentarios_quejas(url: str):
         return {
             "quejas_detectadas": quejas_encontradas,
             "total_quejas": len(quejas_encontradas),
+            "conteo_quejas": dict(conteo_quejas),
             "secciones_comentarios": secciones_comentarios,
             "tiene_comentarios_negativos": len(quejas_encontradas) > 0 or len(secciones_comentarios) > 0,
             "puntuacion_riesgo": min(0.7, len(quejas_encontradas) * 0.1 + len(secciones_comentarios) * 0.2)
         }
         
     except Exception:
-        return {
-            "quejas_detectadas": [],
-            "total_quejas": 0,
-            "secciones_comentarios": [],
-            "tiene_comentarios_negativos": False,
-            "puntuacion_riesgo": 0.0
-        }
+        ERRORES_VERIFICACION.incrementar(verificacion="comentarios_quejas")
+        return resultado_por_defecto("comentarios_quejas")
 
-def verificar_enlaces_rotos(url: str):
+def verificar_enlaces_rotos(url: str, pagina=None):
     """Verifica si los enlaces importantes llevan a ninguna parte"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        from urllib.parse import urljoin
-        
-        response = requests.get(url, timeout=8, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.text, 'html.parser')
+        pagina = pagina or descargar_pagina(url, timeout=8)
+        pagina.verificar()
         
         enlaces_importantes = []
         enlaces_rotos = []
         
         # Enlaces críticos que deben funcionar
         enlaces_criticos = []
-        for link in soup.find_all('a', href=True):
-            href = link['href'].lower()
-            text = link.get_text().lower()
-            
+        for href, text in pagina.enlaces:
             # Identificar enlaces importantes
-            if any(p in href or p in text for p in [
-                'contacto', 'contact', 'about', 'nosotros', 'soporte', 
-                'help', 'ayuda', 'terminos', 'terms', 'privacidad', 'privacy',
-                'devolucion', 'return', 'garantia', 'warranty'
-            ]):
+            if BUSCADOR_ENLACES_CRITICOS.contiene_alguno(href) or BUSCADOR_ENLACES_CRITICOS.contiene_alguno(text):
                 enlaces_criticos.append({
                     'texto': text,
                     'href': href,
                     'es_externo': href.startswith('http') and url not in href
                 })
         
-        # Verificar algunos enlaces críticos (muestra)
-        for enlace in enlaces_criticos[:5]:  # Limitar a 5 para no saturar
-            try:
-                if enlace['es_externo']:
-                    # Para enlaces externos, verificar solo disponibilidad
-                    enlaces_importantes.append({
-                        'url': enlace['href'],
-                        'estado': 'externo',
-                        'texto': enlace['texto'][:50] + '...' if len(enlace['texto']) > 50 else enlace['texto']
-                    })
-                else:
-                    # Para enlaces internos, verificar respuesta
-                    link_url = urljoin(url, enlace['href'])
-                    resp = requests.head(link_url, timeout=3, allow_redirects=True)
-                    if resp.status_code >= 400:
-                        enlaces_rotos.append({
-                            'url': link_url,
-                            'estado': f'error_{resp.status_code}',
-                            'texto': enlace['texto'][:50] + '...' if len(enlace['texto']) > 50 else enlace['texto']
-                        })
-                    else:
-                        enlaces_importantes.append({
-                            'url': link_url,
-                            'estado': f'ok_{resp.status_code}',
-                            'texto': enlace['texto'][:50] + '...' if len(enlace['texto']) > 50 else enlace['texto']
-                        })
-            except:
+        # Verificar una muestra de enlaces críticos; los internos se sondean en paralelo
+        base = _base_enlaces(url, pagina)
+        muestra = enlaces_criticos[:MAX_ENLACES_CRITICOS]
+        estados = probador_enlaces.probar(
+            urljoin(base, enlace['href']) for enlace in muestra if not enlace['es_externo']
+        )
+        for enlace in muestra:
+            texto = enlace['texto'][:50] + '...' if len(enlace['texto']) > 50 else enlace['texto']
+            if enlace['es_externo']:
+                # Para enlaces externos, verificar solo disponibilidad
+                enlaces_importantes.append({
+                    'url': enlace['href'],
+                    'estado': 'externo',
+                    'texto': texto
+                })
+                continue
+            
+            # Para enlaces internos, verificar respuesta
+            link_url = urljoin(base, enlace['href'])
+            status = estados.get(link_url)
+            if status is None:
                 enlaces_rotos.append({
                     'url': enlace['href'],
                     'estado': 'timeout_error',
-                    'texto': enlace['texto'][:50] + '...' if len(enlace['texto']) > 50 else enlace['texto']
+                    'texto': texto
+                })
+            elif status >= 400:
+                enlaces_rotos.append({
+                    'url': link_url,
+                    'estado': f'error_{status}',
+                    'texto': texto
+                })
+            else:
+                enlaces_importantes.append({
+                    'url': link_url,
+                    'estado': f'ok_{status}',
+                    'texto': texto
                 })
         
         return {
@@ -269,21 +474,17 @@ def verificar_enlaces_rotos(url: str):
         }
         
     except Exception:
-        return {
-            "enlaces_importantes": [],
-            "enlaces_rotos": [],
-            "total_enlaces_rotos": 0,
-            "tiene_enlaces_rotos": False,
-            "puntuacion_riesgo": 0.0
-        }
+        ERRORES_VERIFICACION.incrementar(verificacion="enlaces_rotos")
+        return resultado_por_defecto("enlaces_rotos")
 
-def verificar_terminos_detallado(url: str):
+def verificar_terminos_detallado(url: str, pagina=None):
     """Verificación más detallada de términos y condiciones"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        
-        terminos_info = verificar_terminos_condiciones(url)
+        terminos_info = verificar_terminos_condiciones(url, pagina)
+        # Los enlaces de la página se resuelven contra la URL final; los de
+        # fuerza bruta se vuelven a verificar en la misma URL que se sondeó
+        base = _base_enlaces(url, pagina)
+        terminos_urls = {enlace: urljoin(base, enlace) for enlace in terminos_info["enlaces_encontrados"]}
         
         # Si no tiene enlaces de términos, verificar directamente páginas comunes
         if not terminos_info["tiene_terminos"]:
@@ -294,42 +495,36 @@ def verificar_terminos_detallado(url: str):
                 "/privacidad"
             ]
             
-            for pagina in paginas_comunes:
-                try:
-                    terminos_url = url + pagina
-                    resp = requests.get(terminos_url, timeout=5)
-                    if resp.status_code == 200:
-                        terminos_info["tiene_terminos"] = True
-                        terminos_info["enlaces_encontrados"].append(pagina)
-                        terminos_info["puntuacion"] = 0.6  # Menor puntuación porque lo encontramos por fuerza bruta
-                        break
-                except:
-                    continue
+            # Se sondean todas a la vez y se respeta el orden de preferencia
+            estados = probador_enlaces.probar(url + ruta for ruta in paginas_comunes)
+            for ruta in paginas_comunes:
+                if estados.get(url + ruta) == 200:
+                    terminos_info["tiene_terminos"] = True
+                    terminos_info["enlaces_encontrados"].append(ruta)
+                    terminos_urls[ruta] = url + ruta
+                    terminos_info["puntuacion"] = 0.6  # Menor puntuación porque lo encontramos por fuerza bruta
+                    break
         
         # Verificar si los enlaces de términos realmente funcionan
+        estados = probador_enlaces.probar(terminos_urls.values())
         enlaces_funcionando = []
-        for enlace in terminos_info["enlaces_encontrados"]:
-            try:
-                terminos_url = url + enlace if enlace.startswith('/') else enlace
-                if not terminos_url.startswith('http'):
-                    terminos_url = url + '/' + enlace
-                
-                resp = requests.head(terminos_url, timeout=3, allow_redirects=True)
-                if resp.status_code == 200:
-                    enlaces_funcionando.append({
-                        'url': terminos_url,
-                        'estado': 'funcionando'
-                    })
-                else:
-                    enlaces_funcionando.append({
-                        'url': terminos_url,
-                        'estado': f'error_{resp.status_code}'
-                    })
-            except:
+        for enlace, terminos_url in terminos_urls.items():
+            status = estados.get(terminos_url)
+            if status is None:
                 enlaces_funcionando.append({
                     'url': enlace,
                     'estado': 'error_conexion'
                 })
+            elif status == 200:
+                enlaces_funcionando.append({
+                    'url': terminos_url,
+                    'estado': 'funcionando'
+                })
+            else:
+                enlaces_funcionando.append({
+                    'url': terminos_url,
+                    'estado': f'error_{status}'
+                })
         
         terminos_info["enlaces_verificados"] = enlaces_funcionando
         terminos_info["enlaces_funcionando"] = len([e for e in enlaces_funcionando if e['estado'] == 'funcionando'])
@@ -345,38 +540,22 @@ def verificar_terminos_detallado(url: str):
         return terminos_info
         
     except Exception:
-        return {
-            "tiene_terminos": False,
-            "enlaces_encontrados": [],
-            "puntuacion": 0.1,
-            "enlaces_funcionando": 0,
-            "tiene_terminos_funcionales": False
-        }
-def verificar_entidades_reguladoras(url: str):
+        ERRORES_VERIFICACION.incrementar(verificacion="terminos_condiciones")
+        return resultado_por_defecto("terminos_condiciones")
+def verificar_entidades_reguladoras(url: str, pagina=None):
     """Verifica menciones a entidades reguladoras"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        
-        response = requests.get(url, timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text().lower()
-        
-        # Entidades reguladoras comunes
-        entidades = {
-            "defensa_consumidor": ["defensa al consumidor", "proconsumo", "derechos del consumidor"],
-            "camara_comercio": ["cámara de comercio", "registro mercantil"],
-            "superintendencia": ["superintendencia", "supersociedades", "superfinanciera"],
-            "reclamos": ["libro de reclamaciones", "sistema de reclamos"],
-            "certificaciones": ["ssl", "https", "certificado", "verisign", "digicert"]
-        }
+        pagina = pagina or descargar_pagina(url, timeout=5)
+        text = pagina.texto_lower
         
+        # Una sola pasada sobre el texto para las palabras de todas las entidades
+        menciones = BUSCADOR_ENTIDADES.contar(text)
         resultados = {}
-        for entidad, palabras in entidades.items():
-            resultados[entidad] = any(palabra in text for palabra in palabras)
+        for entidad, palabras in ENTIDADES_REGULADORAS.items():
+            resultados[entidad] = any(palabra in menciones for palabra in palabras)
         
         # Calcular puntuación
-        puntuacion = sum(1 for tiene in resultados.values() if tiene) / len(entidades)
+        puntuacion = sum(1 for tiene in resultados.values() if tiene) / len(ENTIDADES_REGULADORAS)
         
         return {
             "menciones_entidades": resultados,
@@ -385,18 +564,14 @@ def verificar_entidades_reguladoras(url: str):
         }
         
     except Exception:
-        return {"menciones_entidades": {}, "puntuacion": 0.1, "total_menciones": 0}
+        ERRORES_VERIFICACION.incrementar(verificacion="entidades_reguladoras")
+        return resultado_por_defecto("entidades_reguladoras")
     
-def verificar_contacto(url: str):
+def verificar_contacto(url: str, pagina=None):
     """Verifica información de contacto válida"""
     try:
-        import requests
-        from bs4 import BeautifulSoup
-        import re
-        
-        response = requests.get(url, timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text()
+        pagina = pagina or descargar_pagina(url, timeout=5)
+        text = pagina.texto
         
         # Buscar información de contacto
         tiene_direccion = re.search(r'\b(calle|avenida|av\.|cra\.|carrera|número|no\.)\b', text, re.IGNORECASE)
@@ -405,9 +580,8 @@ def verificar_contacto(url: str):
         
         # Buscar enlaces de contacto
         contact_links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href'].lower()
-            if any(x in href for x in ['contacto', 'contact', 'about', 'nosotros', 'soporte']):
+        for href, _ in pagina.enlaces:
+            if BUSCADOR_CONTACTO.contiene_alguno(href):
                 contact_links.append(href)
         
         return {
@@ -419,85 +593,206 @@ def verificar_contacto(url: str):
         }
         
     except Exception:
-        return {"tiene_direccion": False, "tiene_telefono": False, "tiene_email": False, "enlaces_contacto": [], "puntuacion": 0.1}
+        ERRORES_VERIFICACION.incrementar(verificacion="informacion_contacto")
+        return resultado_por_defecto("informacion_contacto")
+
+# Verificaciones del sitio, indexadas por su clave en `detalles`
+VERIFICACIONES = {
+    "terminos_condiciones": verificar_terminos_detallado,
+    "entidades_reguladoras": verificar_entidades_reguladoras,
+    "informacion_contacto": verificar_contacto,
+    "comentarios_quejas": verificar_comentarios_quejas,
+    "enlaces_rotos": verificar_enlaces_rotos,
+}
+
+def _cronometrar(nombre, verificacion, url, pagina, tiempos):
+    with DURACION_VERIFICACION.cronometro(verificacion=nombre) as medicion:
+        resultado = verificacion(url, pagina)
+    tiempos[nombre] = medicion.ms
+    return resultado
+
+def _descargar_y_parsear(url, timeout):
+    """Descarga compartida por todas las verificaciones, ya parseada"""
+    pagina = descargar_pagina(url, timeout=timeout)
+    if pagina.error is None:
+        # Varias verificaciones necesitan el texto: un único parseo completo
+        # evita que las que solo leen enlaces parseen el documento por su cuenta
+        try:
+            pagina.parsear()
+        except Exception:
+            pass
+    return pagina
+
+def _resultados_por_defecto(**marcas):
+    resultados = {}
+    for nombre in VERIFICACIONES:
+        resultados[nombre] = resultado_por_defecto(nombre)
+        resultados[nombre].update(marcas)
+    return resultados
 
-def predecir_ecommerce(url: str):
-    """Predice si un ecommerce es confiable o pirata con verificaciones completas"""
+def ejecutar_verificaciones(url: str, timeout: float = None, tiempos: dict = None):
+    """Ejecuta todas las verificaciones en paralelo bajo un único plazo global.
+
+    Devuelve los resultados por verificación y la lista de las que no
+    terminaron a tiempo (reemplazadas por su resultado por defecto). Si se
+    pasa `tiempos`, se completa con los milisegundos de la descarga, el
+    parseo y cada verificación terminada.
+    """
+    timeout = ANALISIS_TIMEOUT if timeout is None else timeout
+    inicio = time.monotonic()
+    limite = inicio + timeout
+    tiempos = {} if tiempos is None else tiempos
+    
+    executor = ThreadPoolExecutor(max_workers=len(VERIFICACIONES))
     try:
+        # Una sola descarga compartida, también bajo el plazo global: el timeout de
+        # requests es por operación de socket y un servidor que envía el cuerpo
+        # byte a byte nunca lo agota
+        descarga = executor.submit(_descargar_y_parsear, url, max(min(8, timeout), 0.1))
+        wait([descarga], timeout=max(limite - inicio, 0))
+        if not descarga.done():
+            tiempos["descarga"] = round((time.monotonic() - inicio) * 1000, 1)
+            tiempos["verificaciones"] = {}
+            for nombre in VERIFICACIONES:
+                TIMEOUTS_VERIFICACION.incrementar(verificacion=nombre)
+            return _resultados_por_defecto(timeout=True), list(VERIFICACIONES)
+
+        pagina = descarga.result()
+        tiempos["descarga"] = round(pagina.tiempo_descarga_ms, 1)
+        if pagina.error is None:
+            tiempos["parseo"] = pagina.tiempo_parseo_ms
+        motivo = cliente_http.motivo_inalcanzable(url) if pagina.error is not None else None
+        if motivo:
+            # Host caído o sin DNS: todas fallarían igual, se devuelven los resultados por defecto
+            tiempos["verificaciones"] = {}
+            return _resultados_por_defecto(host_inalcanzable=motivo), []
+
+        tiempos_verificaciones = tiempos.setdefault("verificaciones", {})
+        futuros = {
+            nombre: executor.submit(_cronometrar, nombre, verificacion, url, pagina, tiempos_verificaciones)
+            for nombre, verificacion in VERIFICACIONES.items()
+        }
+        wait(futuros.values(), timeout=max(limite - time.monotonic(), 0))
+    finally:
+        # No esperar a la descarga ni a las verificaciones atrasadas: terminan solas
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    resultados = {}
+    con_timeout = []
+    for nombre, futuro in futuros.items():
+        if futuro.done() and not futuro.cancelled():
+            resultados[nombre] = futuro.result()
+        else:
+            resultados[nombre] = resultado_por_defecto(nombre)
+            resultados[nombre]["timeout"] = True
+            con_timeout.append(nombre)
+            TIMEOUTS_VERIFICACION.incrementar(verificacion=nombre)
+    # Copia sin las atrasadas, que siguen escribiendo en el diccionario compartido
+    tiempos["verificaciones"] = {
+        nombre: tiempos_verificaciones[nombre] for nombre in futuros if nombre in tiempos_verificaciones
+    }
+
+    return resultados, con_timeout
+
+def veredicto_lexico(url: str):
+    """Veredicto inmediato a partir solo de la URL, sin descargar nada.
+
+    Las verificaciones profundas solo suman riesgo: si la URL ya alcanza el
+    umbral, el resultado será "pirata" de todos modos. Devuelve None cuando
+    hace falta el análisis profundo para decidir.
+    """
+    features = extraer_features(url)
+    riesgo = calcular_riesgo_url(features)
+    if riesgo < UMBRAL_RIESGO:
+        return None
+    
+    riesgo = min(riesgo, 1.0)
+    detalles = obtener_detalles_analisis(url, features)
+    detalles.update({
+        "nivel_analisis": NIVEL_LEXICO,
+        "verificaciones_completadas": False,
+        "verificaciones_con_timeout": [],
+        "puntuacion_riesgo": round(riesgo, 2),
+        "nivel_riesgo": obtener_nivel_riesgo(riesgo),
+        "decision": f"Umbral: {UMBRAL_RIESGO}, Riesgo URL: {riesgo:.2f}, Veredicto léxico sin rastreo"
+    })
+    return "pirata", max(riesgo, 0.7), detalles
+
+def predecir_ecommerce(url: str, timeout: float = None, profundo: bool = False):
+    """Predice si un ecommerce es confiable o pirata.
+
+    Si la URL ya es claramente sospechosa se devuelve el veredicto léxico;
+    con `profundo=True` siempre se ejecutan las verificaciones completas.
+    """
+    inicio = time.perf_counter()
+    tiempos = {}
+    resultado, confianza, detalles = _predecir_ecommerce(url, timeout, profundo, tiempos)
+    segundos = time.perf_counter() - inicio
+    DURACION_PREDICCION.observar(segundos, nivel=detalles.get("nivel_analisis", "error"))
+    if DETALLES_TIEMPOS:
+        tiempos["total"] = round(segundos * 1000, 1)
+        detalles["tiempos_ms"] = tiempos
+    return resultado, confianza, detalles
+
+def _predecir_ecommerce(url, timeout, profundo, tiempos):
+    try:
+        if not profundo:
+            lexico = veredicto_lexico(url)
+            if lexico is not None:
+                return lexico
+        
         # Extraer características básicas de la URL
         features = extraer_features(url)
         
-        # Obtener valores individuales para mejor legibilidad
-        palabras_sospechosas = features[3]
-        caracteres_especiales = features[4]
-        tiene_https = features[2]
-        tiene_ip = features[5]
-        ratio_numeros = features[7]
-        
         # Calcular puntuación de riesgo base (0-1)
-        riesgo = 0.0
-        
         # 1. Análisis de la URL (riesgo base)
-        if palabras_sospechosas >= 3:
-            riesgo += 0.4
-        elif palabras_sospechosas == 2:
-            riesgo += 0.2
-        elif palabras_sospechosas == 1:
-            riesgo += 0.1
+        riesgo = calcular_riesgo_url(features)
         
-        if tiene_https == 0:
-            riesgo += 0.3
+        # 2. Verificaciones adicionales detalladas (en paralelo, con plazo global)
+        verificaciones, con_timeout = ejecutar_verificaciones(url, timeout, tiempos)
+        terminos_info = verificaciones["terminos_condiciones"]
+        entidades_info = verificaciones["entidades_reguladoras"]
+        contacto_info = verificaciones["informacion_contacto"]
+        quejas_info = verificaciones["comentarios_quejas"]
+        enlaces_info = verificaciones["enlaces_rotos"]
         
-        if tiene_ip == 1:
-            riesgo += 0.3
-        
-        if caracteres_especiales >= 4:
-            riesgo += 0.2
-        elif caracteres_especiales >= 2:
-            riesgo += 0.1
-        
-        if ratio_numeros > 0.25:
-            riesgo += 0.2
-        elif ratio_numeros > 0.15:
-            riesgo += 0.1
+        # Las verificaciones sin terminar (plazo agotado o host inalcanzable)
+        # llevan su resultado por defecto: no cuentan para las reglas ni el riesgo
+        omitidas = set(VERIFICACIONES) if terminos_info.get("host_inalcanzable") else set(con_timeout)
         
-        # 2. Verificaciones adicionales detalladas
-        terminos_info = verificar_terminos_detallado(url)
-        entidades_info = verificar_entidades_reguladoras(url)
-        contacto_info = verificar_contacto(url)
-        quejas_info = verificar_comentarios_quejas(url)
-        enlaces_info = verificar_enlaces_rotos(url)
+        def evaluada(nombre):
+            return nombre not in omitidas
         
         # 🔥 NUEVAS REGLAS ESTRICTAS - SI CUMPLE ALGUNA, ES PIRATA
         es_claramente_pirata = False
         razones_pirata = []
         
         # Regla 1: Sin términos y condiciones funcionales
-        if not terminos_info["tiene_terminos_funcionales"]:
+        if evaluada("terminos_condiciones") and not terminos_info["tiene_terminos_funcionales"]:
             es_claramente_pirata = True
             razones_pirata.append("❌ No tiene términos y condiciones funcionales")
             riesgo += 0.4
         
         # Regla 2: Tiene quejas de usuarios
-        if quejas_info["tiene_comentarios_negativos"] and quejas_info["total_quejas"] >= 3:
+        if evaluada("comentarios_quejas") and quejas_info["tiene_comentarios_negativos"] and quejas_info["total_quejas"] >= 3:
             es_claramente_pirata = True
             razones_pirata.append(f"❌ Tiene {quejas_info['total_quejas']} quejas de usuarios detectadas")
             riesgo += 0.3
         
         # Regla 3: Muchos enlaces rotos en secciones importantes
-        if enlaces_info["total_enlaces_rotos"] >= 3:
+        if evaluada("enlaces_rotos") and enlaces_info["total_enlaces_rotos"] >= 3:
             es_claramente_pirata = True
             razones_pirata.append(f"❌ Tiene {enlaces_info['total_enlaces_rotos']} enlaces rotos en secciones importantes")
             riesgo += 0.3
         
         # Ajustes de riesgo adicionales
-        if not terminos_info["tiene_terminos"]:
+        if evaluada("terminos_condiciones") and not terminos_info["tiene_terminos"]:
             riesgo += 0.15
         
-        if entidades_info["total_menciones"] == 0:
+        if evaluada("entidades_reguladoras") and entidades_info["total_menciones"] == 0:
             riesgo += 0.10
             
-        if contacto_info["puntuacion"] < 0.5:
+        if evaluada("informacion_contacto") and contacto_info["puntuacion"] < 0.5:
             riesgo += 0.10
         
         riesgo += quejas_info["puntuacion_riesgo"]
@@ -507,7 +802,7 @@ def predecir_ecommerce(url: str):
         riesgo = min(riesgo, 1.0)
         
         # 3. DECISIÓN FINAL - REGLAS ESTRICTAS
-        if es_claramente_pirata or riesgo >= 0.3:  # Umbral más bajo
+        if es_claramente_pirata or riesgo >= UMBRAL_RIESGO:  # Umbral más bajo
             resultado = "pirata"
             confianza = max(riesgo, 0.7)  # Mínimo 70% de confianza si es pirata por reglas estrictas
         else:
@@ -519,22 +814,32 @@ def predecir_ecommerce(url: str):
         
         # Agregar todas las verificaciones
         detalles.update({
+            "nivel_analisis": NIVEL_PROFUNDO,
             "terminos_condiciones": terminos_info,
             "entidades_reguladoras": entidades_info,
             "informacion_contacto": contacto_info,
             "comentarios_quejas": quejas_info,
             "enlaces_rotos": enlaces_info,
-            "verificaciones_completadas": True,
+            "verificaciones_completadas": not con_timeout,
+            "verificaciones_con_timeout": con_timeout,
             "reglas_estrictas": {
                 "es_claramente_pirata": es_claramente_pirata,
                 "razones": razones_pirata if es_claramente_pirata else ["✅ No se activaron reglas estrictas de piratería"]
             }
         })
         
+        motivo_inalcanzable = terminos_info.get("host_inalcanzable")
+        if motivo_inalcanzable:
+            detalles["host_inalcanzable"] = motivo_inalcanzable
+            detalles["verificaciones_completadas"] = False
+            detalles["advertencia"] = f"Host inalcanzable ({motivo_inalcanzable}): verificaciones omitidas"
+        elif con_timeout:
+            detalles["advertencia"] = f"Verificaciones sin terminar dentro del plazo: {', '.join(con_timeout)}"
+        
         # Agregar puntuación de riesgo
         detalles["puntuacion_riesgo"] = round(riesgo, 2)
         detalles["nivel_riesgo"] = obtener_nivel_riesgo(riesgo)
-        detalles["decision"] = f"Umbral: 0.3, Riesgo: {riesgo:.2f}, Reglas estrictas: {es_claramente_pirata}"
+        detalles["decision"] = f"Umbral: {UMBRAL_RIESGO}, Riesgo: {riesgo:.2f}, Reglas estrictas: {es_claramente_pirata}"
         
         return resultado, confianza, detalles
         
@@ -556,6 +861,14 @@ def predecir_ecommerce(url: str):
             "puntuacion_riesgo": 0.8
         }
 
+def es_persistible(detalles: dict) -> bool:
+    """Solo se guardan en la BD y la caché los veredictos léxicos y los profundos
+    completos: uno con verificaciones sin terminar (plazo agotado, host
+    inalcanzable, error) refleja un fallo pasajero, no la tienda"""
+    if detalles.get("nivel_analisis") == NIVEL_LEXICO:
+        return True
+    return bool(detalles.get("verificaciones_completadas")) and not detalles.get("host_inalcanzable")
+
 def obtener_nivel_riesgo(puntuacion: float) -> str:
     """Convierte la puntuación de riesgo en un nivel descriptivo"""
     if puntuacion >= 0.7:
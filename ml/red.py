@@ -0,0 +1,398 @@
+import os
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import nullcontext
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from urllib3.exceptions import ConnectTimeoutError, ReadTimeoutError
+
+from ml.metricas import DURACION_DESCARGA, ERRORES_DESCARGA, HOSTS_INALCANZABLES
+
+HEADERS_POR_DEFECTO = {'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, deflate'}
+
+# Tamaño máximo (ya descomprimido) que se acepta de un cuerpo de respuesta
+MAX_BYTES_RESPUESTA = int(os.getenv('MAX_BYTES_RESPUESTA', str(5 * 1024 * 1024)))
+# Peticiones simultáneas como máximo contra un mismo host
+MAX_CONEXIONES_POR_HOST = int(os.getenv('MAX_CONEXIONES_POR_HOST', '4'))
+# Peticiones por segundo como máximo contra un mismo host (admite ráfagas de ese tamaño)
+MAX_PETICIONES_POR_SEGUNDO_HOST = float(os.getenv('MAX_PETICIONES_POR_SEGUNDO_HOST', '5'))
+# Segundos que un host sin DNS o que no responde se da por inalcanzable
+HOST_INALCANZABLE_TTL_SEGUNDOS = float(os.getenv('HOST_INALCANZABLE_TTL_SEGUNDOS', '120'))
+# Timeouts de lectura seguidos que hacen falta para darlo por inalcanzable
+HOST_MAX_TIMEOUTS_LECTURA = int(os.getenv('HOST_MAX_TIMEOUTS_LECTURA', '3'))
+# Hosts distintos cuyas conexiones keep-alive se conservan
+MAX_HOSTS_EN_POOL = int(os.getenv('MAX_HOSTS_EN_POOL', '100'))
+
+TAMANO_BLOQUE = 64 * 1024
+# Reintento de `reservar` cuando todas las conexiones del host están ocupadas
+ESPERA_HOST_OCUPADO = 0.05
+
+
+def clave_host(url):
+    """Host (con puerto) al que se aplican los límites de cortesía"""
+    return urlparse(url).netloc.lower()
+
+
+class RespuestaDemasiadoGrande(Exception):
+    """El cuerpo de la respuesta supera el tamaño máximo permitido"""
+
+
+class HostInalcanzable(requests.exceptions.ConnectionError):
+    """El host falló por DNS o timeout hace poco: la petición se descarta sin conectar"""
+
+
+class RespuestaHTTP:
+    """Respuesta ya leída (y acotada) de una petición HTTP"""
+
+    def __init__(self, status_code, url, headers, contenido=b"", tiempo_ms=0.0):
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers
+        self.contenido = contenido
+        self.tiempo_ms = tiempo_ms
+
+    @property
+    def encoding(self):
+        """Charset declarado en Content-Type (None si no lo declara)"""
+        content_type = self.headers.get('Content-Type', '')
+        if 'charset' not in content_type.lower():
+            return None
+        return get_encoding_from_headers(self.headers)
+
+
+class _DescompresorDeflate:
+    """`Content-Encoding: deflate` llega con cabecera zlib o en deflate crudo.
+
+    Como urllib3: se prueba zlib y, si el primer bloque falla, se reintenta
+    lo recibido hasta entonces como deflate crudo.
+    """
+
+    def __init__(self):
+        self._objeto = zlib.decompressobj()
+        self._recibido = b""
+        self._primer_intento = True
+
+    @property
+    def unconsumed_tail(self):
+        return self._objeto.unconsumed_tail
+
+    def decompress(self, datos, max_length=0):
+        if not self._primer_intento:
+            return self._objeto.decompress(datos, max_length)
+        self._recibido += datos
+        try:
+            salida = self._objeto.decompress(datos, max_length)
+        except zlib.error:
+            self._primer_intento = False
+            self._objeto = zlib.decompressobj(-zlib.MAX_WBITS)
+            recibido, self._recibido = self._recibido, b""
+            return self._objeto.decompress(recibido, max_length)
+        if salida:
+            self._primer_intento = False
+            self._recibido = b""
+        return salida
+
+    def flush(self):
+        return self._objeto.flush()
+
+
+def _descompresor(codificacion):
+    codificacion = codificacion.lower().strip()
+    if codificacion in ('', 'identity'):
+        return None
+    if codificacion in ('gzip', 'x-gzip'):
+        # 32 + MAX_WBITS detecta automáticamente cabecera gzip o zlib
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+    if codificacion == 'deflate':
+        return _DescompresorDeflate()
+    raise ValueError(f"Content-Encoding no soportado: {codificacion}")
+
+
+def _leer_cuerpo(resp, max_bytes):
+    """Lee el cuerpo en bloques, descomprimiendo con límite para frenar bombas de compresión"""
+    longitud = resp.headers.get('Content-Length')
+    descompresor = _descompresor(resp.headers.get('Content-Encoding', ''))
+    if descompresor is None and longitud and longitud.isdigit() and int(longitud) > max_bytes:
+        raise RespuestaDemasiadoGrande(f"Content-Length {longitud} supera {max_bytes} bytes")
+
+    partes = []
+    total = 0
+    for bloque in resp.raw.stream(TAMANO_BLOQUE, decode_content=False):
+        if descompresor is not None:
+            bloque = descompresor.decompress(bloque, max_bytes - total + 1)
+            if descompresor.unconsumed_tail:
+                raise RespuestaDemasiadoGrande(f"El cuerpo descomprimido supera {max_bytes} bytes")
+        total += len(bloque)
+        if total > max_bytes:
+            raise RespuestaDemasiadoGrande(f"El cuerpo supera {max_bytes} bytes")
+        partes.append(bloque)
+    if descompresor is not None:
+        partes.append(descompresor.flush())
+        if total + len(partes[-1]) > max_bytes:
+            raise RespuestaDemasiadoGrande(f"El cuerpo descomprimido supera {max_bytes} bytes")
+    return b"".join(partes)
+
+
+def _cadena(error):
+    """El error y todos los que lo causaron (requests y urllib3 los envuelven)"""
+    vistos = set()
+    pendientes = [error]
+    while pendientes:
+        actual = pendientes.pop()
+        if actual is None or id(actual) in vistos:
+            continue
+        vistos.add(id(actual))
+        yield actual
+        pendientes.extend((actual.__cause__, actual.__context__, getattr(actual, 'reason', None)))
+        pendientes.extend(arg for arg in getattr(actual, 'args', ()) if isinstance(arg, BaseException))
+
+
+def _tipo_fallo(error):
+    """'dns', 'conexion' o 'lectura' si el error indica un host caído o lento; None si no"""
+    cadena = list(_cadena(error))
+    if any(isinstance(e, socket.gaierror) for e in cadena):
+        return 'dns'
+    if any(isinstance(e, (requests.exceptions.ConnectTimeout, ConnectTimeoutError)) for e in cadena):
+        return 'conexion'
+    if any(isinstance(e, (requests.exceptions.Timeout, ReadTimeoutError, socket.timeout)) for e in cadena):
+        return 'lectura'
+    return None
+
+
+class CuboTokens:
+    """Limita el ritmo a `por_segundo` peticiones, con ráfagas de hasta `capacidad`"""
+
+    def __init__(self, por_segundo, capacidad=None):
+        self.por_segundo = por_segundo
+        self.capacidad = capacidad or max(por_segundo, 1)
+        self._tokens = self.capacidad
+        self._actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._actualizado) * self.por_segundo)
+        self._actualizado = ahora
+
+    def reservar(self):
+        """Toma un token; devuelve los segundos que hay que esperar antes de usarlo"""
+        if self.por_segundo <= 0:
+            return 0.0
+        with self._lock:
+            self._rellenar()
+            # Los tokens pueden quedar en negativo: cada petición espera su turno
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.por_segundo)
+
+    def intentar(self):
+        """Toma un token solo si ya hay uno; si no, devuelve los segundos hasta que lo haya"""
+        if self.por_segundo <= 0:
+            return 0.0
+        with self._lock:
+            self._rellenar()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.por_segundo
+
+
+class EstadoHost:
+    """Cortesía y caché negativa de un host: conexiones simultáneas, ritmo y fallos recientes"""
+
+    def __init__(self, max_simultaneas, por_segundo):
+        self.semaforo = threading.BoundedSemaphore(max_simultaneas)
+        self.cubo = CuboTokens(por_segundo)
+        self.inalcanzable_hasta = 0.0
+        self.motivo = None
+        self.timeouts_lectura = 0
+        # Peticiones y reservas en curso: mientras haya alguna el estado no se desaloja
+        self.referencias = 0
+
+
+class ClienteHTTP:
+    """Capa de descarga compartida por todas las verificaciones.
+
+    Reutiliza conexiones (keep-alive) con una sesión única y es cortés con
+    cada host: limita sus peticiones simultáneas y por segundo. Un host que
+    no resuelve por DNS o no responde a tiempo queda marcado como
+    inalcanzable durante `ttl_inalcanzable` segundos y sus peticiones
+    fallan al instante con HostInalcanzable. El estado se guarda para
+    `max_hosts` hosts como máximo: al superarlo se desaloja el usado hace más
+    tiempo que esté inactivo y no marcado. También corta los cuerpos que
+    superan `max_bytes` mientras se descargan y mide cada petición.
+    """
+
+    def __init__(self, max_por_host=MAX_CONEXIONES_POR_HOST, max_hosts=MAX_HOSTS_EN_POOL,
+                 max_bytes=MAX_BYTES_RESPUESTA, por_segundo=MAX_PETICIONES_POR_SEGUNDO_HOST,
+                 ttl_inalcanzable=HOST_INALCANZABLE_TTL_SEGUNDOS,
+                 max_timeouts_lectura=HOST_MAX_TIMEOUTS_LECTURA):
+        self.max_por_host = max_por_host
+        self.max_hosts = max_hosts
+        self.max_bytes = max_bytes
+        self.por_segundo = por_segundo
+        self.ttl_inalcanzable = ttl_inalcanzable
+        self.max_timeouts_lectura = max_timeouts_lectura
+        self._sesion = requests.Session()
+        self._sesion.headers.update(HEADERS_POR_DEFECTO)
+        adaptador = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=max_por_host)
+        self._sesion.mount('http://', adaptador)
+        self._sesion.mount('https://', adaptador)
+        self._hosts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tomar_host(self, url):
+        """Estado del host de la URL, fijado hasta `_soltar_host`"""
+        host = clave_host(url)
+        with self._lock:
+            estado = self._hosts.get(host)
+            if estado is None:
+                estado = self._hosts[host] = EstadoHost(self.max_por_host, self.por_segundo)
+                self._desalojar()
+            self._hosts.move_to_end(host)
+            estado.referencias += 1
+            return host, estado
+
+    def _soltar_host(self, estado):
+        with self._lock:
+            estado.referencias -= 1
+
+    def _desalojar(self):
+        # LRU: el primero es el usado hace más tiempo; los hosts en uso o
+        # marcados como inalcanzables se conservan
+        ahora = time.monotonic()
+        while len(self._hosts) > self.max_hosts:
+            for host, estado in self._hosts.items():
+                if estado.referencias == 0 and estado.inalcanzable_hasta <= ahora:
+                    del self._hosts[host]
+                    break
+            else:
+                return
+
+    def reservar(self, url):
+        """Intenta ocupar, sin esperar, una conexión y un turno del host de la URL.
+
+        Devuelve 0 si lo consiguió: las peticiones se hacen entonces con
+        `reservado=True` y al terminar se llama a `liberar`. Si no, devuelve
+        los segundos tras los que conviene volver a intentarlo.
+        """
+        _, estado = self._tomar_host(url)
+        espera = ESPERA_HOST_OCUPADO
+        if estado.semaforo.acquire(blocking=False):
+            espera = estado.cubo.intentar()
+            if espera:
+                estado.semaforo.release()
+        if espera:
+            self._soltar_host(estado)
+        return espera
+
+    def liberar(self, url):
+        """Devuelve la conexión ocupada con `reservar`"""
+        with self._lock:
+            # La reserva mantiene fijado el estado: sigue en el diccionario
+            estado = self._hosts[clave_host(url)]
+        estado.semaforo.release()
+        self._soltar_host(estado)
+
+    def motivo_inalcanzable(self, url):
+        """Por qué el host de la URL está marcado como inalcanzable, o None"""
+        with self._lock:
+            estado = self._hosts.get(clave_host(url))
+        if estado is not None and estado.inalcanzable_hasta > time.monotonic():
+            return estado.motivo
+        return None
+
+    def _registrar_fallo(self, host, estado, error):
+        """Marca el host si el error lo indica; devuelve el motivo o None"""
+        tipo = _tipo_fallo(error)
+        if tipo is None:
+            return None
+        with self._lock:
+            if tipo == 'lectura':
+                # Un timeout de lectura aislado puede ser una página lenta: solo cuentan seguidos
+                estado.timeouts_lectura += 1
+                if estado.timeouts_lectura < self.max_timeouts_lectura:
+                    return None
+            motivo = {
+                'dns': 'no resuelve por DNS',
+                'conexion': 'timeout al conectar',
+                'lectura': f'{estado.timeouts_lectura} timeouts de lectura seguidos',
+            }[tipo]
+            estado.inalcanzable_hasta = time.monotonic() + self.ttl_inalcanzable
+            estado.motivo = motivo
+            estado.timeouts_lectura = 0
+        print(f"Host inalcanzable durante {self.ttl_inalcanzable:.0f}s: {host} ({motivo})")
+        return motivo
+
+    def solicitar(self, metodo, url, timeout, headers=None, leer_cuerpo=True, max_bytes=None,
+                  reservado=False):
+        """Hace la petición y devuelve una RespuestaHTTP con el cuerpo ya leído.
+
+        Con `leer_cuerpo=False` solo se obtienen estado y cabeceras. Con
+        `reservado=True` la conexión y el turno del host ya se tomaron con
+        `reservar`.
+        """
+        host, estado = self._tomar_host(url)
+        try:
+            return self._solicitar(host, estado, metodo, url, timeout, headers, leer_cuerpo,
+                                   max_bytes, reservado)
+        finally:
+            self._soltar_host(estado)
+
+    def _solicitar(self, host, estado, metodo, url, timeout, headers, leer_cuerpo, max_bytes, reservado):
+        motivo = self.motivo_inalcanzable(url)
+        if motivo:
+            HOSTS_INALCANZABLES.incrementar(metodo=metodo)
+            raise HostInalcanzable(f"Host inalcanzable: {host} ({motivo})")
+
+        inicio = time.perf_counter()
+        try:
+            with nullcontext() if reservado else estado.semaforo:
+                espera = 0.0 if reservado else estado.cubo.reservar()
+                if espera:
+                    time.sleep(espera)
+                resp = self._sesion.request(
+                    metodo, url, timeout=timeout, headers=headers,
+                    allow_redirects=True, stream=True
+                )
+                try:
+                    contenido = _leer_cuerpo(resp, max_bytes or self.max_bytes) if leer_cuerpo else b""
+                except BaseException:
+                    resp.close()
+                    raise
+                if leer_cuerpo or metodo == 'HEAD':
+                    # Cuerpo consumido por completo: la conexión vuelve al pool (keep-alive)
+                    resp.raw.release_conn()
+                else:
+                    resp.close()
+        except Exception as e:
+            ERRORES_DESCARGA.incrementar(metodo=metodo)
+            motivo = self._registrar_fallo(host, estado, e)
+            if motivo:
+                raise HostInalcanzable(f"Host inalcanzable: {host} ({motivo})") from e
+            raise
+        estado.timeouts_lectura = 0
+        segundos = time.perf_counter() - inicio
+        DURACION_DESCARGA.observar(segundos, metodo=metodo)
+        return RespuestaHTTP(
+            resp.status_code,
+            resp.url,
+            resp.headers,
+            contenido,
+            tiempo_ms=segundos * 1000
+        )
+
+    def get(self, url, timeout, **kwargs):
+        return self.solicitar('GET', url, timeout, **kwargs)
+
+    def head(self, url, timeout, **kwargs):
+        return self.solicitar('HEAD', url, timeout, leer_cuerpo=False, **kwargs)
+
+
+# Cliente compartido por todo el proceso
+cliente_http = ClienteHTTP()
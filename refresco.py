@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import traceback
+
+from db import (list_stale_urls, save_analysis, get_analysis, reclamar_analisis, liberar_analisis,
+                es_obsoleto, ANALISIS_PENDIENTE_VENCE_SEGUNDOS)
+from ml.predictor import predecir_ecommerce, es_persistible, NIVEL_PROFUNDO
+
+# Frecuencia del barrido de filas obsoletas y cuántas se encolan por barrido
+REFRESCO_INTERVALO_SEGUNDOS = float(os.getenv('REFRESCO_INTERVALO_SEGUNDOS', '600'))
+REFRESCO_LOTE = int(os.getenv('REFRESCO_LOTE', '50'))
+# Límite de reanálisis en segundo plano por minuto
+REFRESCO_MAX_POR_MINUTO = float(os.getenv('REFRESCO_MAX_POR_MINUTO', '30'))
+
+
+def reanalizar(url):
+    """Vuelve a analizar una URL y guarda el nuevo veredicto.
+
+    Todos los procesos barren las mismas filas: la URL se reclama como en
+    `analisis._analizar_coordinado` y se omite si otro la está analizando o
+    ya la refrescó. Un veredicto profundo se refresca también en profundidad,
+    sin caer en el léxico. Si el host está inalcanzable se conserva el veredicto
+    anterior.
+    """
+    if not reclamar_analisis(url, ANALISIS_PENDIENTE_VENCE_SEGUNDOS):
+        return
+    try:
+        actual = get_analysis(url)
+        if actual and not es_obsoleto(actual):
+            return
+        profundo = bool(actual) and actual.get("detalles", {}).get("nivel_analisis") == NIVEL_PROFUNDO
+        resultado, confianza, detalles = predecir_ecommerce(url, profundo=profundo)
+        if es_persistible(detalles):
+            save_analysis(url, resultado, confianza, detalles)
+    finally:
+        liberar_analisis(url)
+
+
+class Refrescador:
+    """Reanaliza en segundo plano los análisis obsoletos (stale-while-revalidate).
+
+    Las URLs llegan por `encolar` (al servir un resultado obsoleto) o por el
+    barrido periódico de las filas más antiguas. Un único hilo las procesa
+    respetando `max_por_minuto`; una URL ya pendiente no se encola dos veces.
+    """
+
+    def __init__(self, analizar=reanalizar, intervalo=REFRESCO_INTERVALO_SEGUNDOS,
+                 lote=REFRESCO_LOTE, max_por_minuto=REFRESCO_MAX_POR_MINUTO):
+        self.analizar = analizar
+        self.intervalo = intervalo
+        self.lote = lote
+        self.pausa = 60 / max_por_minuto if max_por_minuto > 0 else 0
+        self._cola = queue.Queue()
+        self._pendientes = set()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilos = []
+
+    def encolar(self, url):
+        """Agenda un reanálisis; devuelve False si ya estaba pendiente"""
+        with self._lock:
+            if url in self._pendientes:
+                return False
+            self._pendientes.add(url)
+        self._cola.put(url)
+        return True
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    def iniciar(self):
+        if self._hilos:
+            return
+        self._parar.clear()
+        self._hilos = [
+            threading.Thread(target=self._procesar, name="refresco-worker", daemon=True),
+            threading.Thread(target=self._barrer, name="refresco-barrido", daemon=True),
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self, timeout=5):
+        self._parar.set()
+        self._cola.put(None)
+        for hilo in self._hilos:
+            hilo.join(timeout)
+        self._hilos = []
+
+    def _procesar(self):
+        while not self._parar.is_set():
+            url = self._cola.get()
+            if url is None:
+                continue
+            try:
+                self.analizar(url)
+            except Exception:
+                print(f"Error al reanalizar {url}: {traceback.format_exc()}")
+            finally:
+                with self._lock:
+                    self._pendientes.discard(url)
+            # Límite de ritmo: espaciar los reanálisis
+            self._parar.wait(self.pausa)
+
+    def _barrer(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                for url in list_stale_urls(limite=self.lote):
+                    self.encolar(url)
+            except Exception as e:
+                print(f"Error en el barrido de análisis obsoletos: {e}")
+
+
+# Refrescador compartido por la API
+refrescador = Refrescador()
@@ -0,0 +1,52 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+PUERTOS_POR_DEFECTO = {'http': 80, 'https': 443}
+
+# Parámetros de campañas y clics que no cambian la página servida
+PARAMETROS_SEGUIMIENTO = frozenset({
+    'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi',
+})
+PREFIJOS_SEGUIMIENTO = ('utm_',)
+
+
+def _es_seguimiento(nombre):
+    nombre = nombre.lower()
+    return nombre in PARAMETROS_SEGUIMIENTO or nombre.startswith(PREFIJOS_SEGUIMIENTO)
+
+
+def _netloc(partes, esquema):
+    try:
+        puerto = partes.port
+    except ValueError:
+        # Puerto inválido: se deja el netloc tal cual, solo en minúsculas
+        return partes.netloc.lower()
+    host = (partes.hostname or '').rstrip('.')
+    if ':' in host:
+        host = f'[{host}]'
+    if puerto is not None and puerto != PUERTOS_POR_DEFECTO.get(esquema):
+        host = f'{host}:{puerto}'
+    usuario, arroba, _ = partes.netloc.rpartition('@')
+    return f'{usuario}{arroba}{host}'
+
+
+def normalizar_url(url: str) -> str:
+    """Forma canónica de una URL, usada como clave de caché y de la base de datos.
+
+    Esquema y host en minúsculas, sin puerto por defecto, sin barra final ni
+    fragmento, con los parámetros ordenados y sin los de seguimiento.
+    """
+    partes = urlsplit(url.strip())
+    esquema = partes.scheme.lower()
+    path = partes.path.rstrip('/')
+    parametros = sorted(
+        (nombre, valor) for nombre, valor in parse_qsl(partes.query, keep_blank_values=True)
+        if not _es_seguimiento(nombre)
+    )
+    return urlunsplit((esquema, _netloc(partes, esquema), path, urlencode(parametros), ''))
+
+
+def clave_url(url: str) -> bytes:
+    """Hash de 16 bytes de la URL canónica (clave de ancho fijo de la tabla analisis)"""
+    return hashlib.blake2b(normalizar_url(url).encode('utf-8'), digest_size=16).digest()
@@ -0,0 +1,134 @@
+"""Worker de rastreo: ejecuta los análisis encolados con POST /trabajos/.
+
+    python worker.py
+
+Se escala por separado de la API. Cada proceso toma trabajos de la tabla
+`trabajos` (FOR UPDATE SKIP LOCKED) y ejecuta hasta TRABAJOS_CONCURRENCIA
+a la vez; un trabajo que falla se reintenta con espera exponencial hasta
+agotar TRABAJOS_MAX_INTENTOS.
+"""
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from analisis import resolver_trabajo
+from db import init_db, init_pool, close_pool, tomar_trabajos, terminar_trabajo, purgar_trabajos
+from ml.predictor import calentar
+
+# Análisis simultáneos por proceso worker
+TRABAJOS_CONCURRENCIA = int(os.getenv('TRABAJOS_CONCURRENCIA', '8'))
+# Intentos por trabajo y espera antes del primer reintento (se duplica en cada uno)
+TRABAJOS_MAX_INTENTOS = int(os.getenv('TRABAJOS_MAX_INTENTOS', '3'))
+TRABAJOS_REINTENTO_SEGUNDOS = float(os.getenv('TRABAJOS_REINTENTO_SEGUNDOS', '30'))
+# Un trabajo en curso más tiempo que esto se da por abandonado (worker caído)
+TRABAJOS_VENCE_SEGUNDOS = float(os.getenv('TRABAJOS_VENCE_SEGUNDOS', '600'))
+# Espera entre consultas cuando la cola está vacía
+TRABAJOS_INTERVALO_SEGUNDOS = float(os.getenv('TRABAJOS_INTERVALO_SEGUNDOS', '1'))
+# Tiempo que se conservan los trabajos terminados, y cada cuánto se purgan
+TRABAJOS_RETENCION_SEGUNDOS = float(os.getenv('TRABAJOS_RETENCION_SEGUNDOS', str(7 * 24 * 3600)))
+TRABAJOS_PURGA_INTERVALO_SEGUNDOS = float(os.getenv('TRABAJOS_PURGA_INTERVALO_SEGUNDOS', '3600'))
+
+
+class Trabajador:
+    """Toma trabajos de la cola y los ejecuta con concurrencia acotada.
+
+    Solo reclama tantos trabajos como huecos libres tiene, así el resto
+    queda disponible para otros workers.
+    """
+
+    def __init__(self, ejecutar=resolver_trabajo, concurrencia=TRABAJOS_CONCURRENCIA,
+                 max_intentos=TRABAJOS_MAX_INTENTOS, reintento=TRABAJOS_REINTENTO_SEGUNDOS,
+                 vencimiento=TRABAJOS_VENCE_SEGUNDOS, intervalo=TRABAJOS_INTERVALO_SEGUNDOS):
+        self.ejecutar = ejecutar
+        self.concurrencia = concurrencia
+        self.max_intentos = max_intentos
+        self.reintento = reintento
+        self.vencimiento = vencimiento
+        self.intervalo = intervalo
+        self._huecos = threading.Semaphore(concurrencia)
+        self._parar = threading.Event()
+
+    def detener(self, *args):
+        self._parar.set()
+
+    def _reservar_huecos(self):
+        if not self._huecos.acquire(timeout=self.intervalo):
+            return 0
+        reservados = 1
+        while reservados < self.concurrencia and self._huecos.acquire(blocking=False):
+            reservados += 1
+        return reservados
+
+    def _procesar(self, id_, url, profundo, intentos):
+        try:
+            analisis, _ = self.ejecutar(url, profundo)
+            if not terminar_trabajo(id_, intentos, resultado=analisis):
+                print(f"El trabajo {id_} ({url}) venció y lo retomó otro worker: se descarta el resultado")
+        except Exception as e:
+            print(f"Error en el trabajo {id_} ({url}), intento {intentos}: {traceback.format_exc()}")
+            reintentar_en = None
+            if intentos < self.max_intentos:
+                reintentar_en = self.reintento * 2 ** (intentos - 1)
+            try:
+                terminar_trabajo(id_, intentos, str(e) or type(e).__name__, reintentar_en)
+            except Exception:
+                # Sin BD el trabajo sigue en curso y se retomará al vencer
+                print(f"No se pudo registrar el fallo del trabajo {id_}: {traceback.format_exc()}")
+        finally:
+            self._huecos.release()
+
+    def _purgar(self):
+        try:
+            borrados = purgar_trabajos(TRABAJOS_RETENCION_SEGUNDOS)
+            if borrados:
+                print(f"Purgados {borrados} trabajos terminados")
+        except Exception as e:
+            print(f"Error al purgar trabajos: {e}")
+
+    def ejecutar_bucle(self):
+        """Procesa la cola hasta que se llame a `detener`; espera a los trabajos en curso"""
+        proxima_purga = 0
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="trabajo") as executor:
+            while not self._parar.is_set():
+                if time.monotonic() >= proxima_purga:
+                    self._purgar()
+                    proxima_purga = time.monotonic() + TRABAJOS_PURGA_INTERVALO_SEGUNDOS
+
+                huecos = self._reservar_huecos()
+                if not huecos:
+                    continue
+                try:
+                    trabajos = tomar_trabajos(huecos, self.vencimiento)
+                except Exception as e:
+                    print(f"Error al tomar trabajos: {e}")
+                    trabajos = []
+                for _ in range(huecos - len(trabajos)):
+                    self._huecos.release()
+
+                for trabajo in trabajos:
+                    executor.submit(self._procesar, *trabajo)
+                if not trabajos:
+                    self._parar.wait(self.intervalo)
+
+
+def main():
+    # Sin el lifespan de FastAPI: esquema, pool y modelos se preparan aquí
+    init_db()
+    init_pool()
+    calentar()
+    trabajador = Trabajador()
+    signal.signal(signal.SIGTERM, trabajador.detener)
+    signal.signal(signal.SIGINT, trabajador.detener)
+    print(f"Worker de trabajos iniciado (concurrencia {trabajador.concurrencia})")
+    try:
+        trabajador.ejecutar_bucle()
+    finally:
+        close_pool()
+    print("Worker de trabajos detenido")
+
+
+if __name__ == '__main__':
+    main()